@@ -0,0 +1,287 @@
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import zlib
+import random
+import shutil
+import argparse
+import tempfile
+import platform
+import threading
+import tracemalloc
+import contextlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from openpyxl import Workbook
+
+import final
+
+
+def make_race_workbook(rows, seed=0):
+    """Генерирует xlsx-файл гонки в формате выгрузки driverslistcsv"""
+    rnd = random.Random(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Список участников')
+    ws.append(['Рейтинг', 'Очки', 'Пилот', 'Команды'])
+    points = sorted((rnd.uniform(0, 100) for _ in range(rows)), reverse=True)
+    for i, value in enumerate(points):
+        pilot = f"ПИЛОТ {rnd.randrange(rows * 4)}"
+        ws.append([i + 1, value, pilot, f"КОМАНДА {rnd.randrange(20)}"])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def make_race_page(races):
+    """Генерирует страницу RaceMann.html со списком гонок"""
+    items = "".join(
+        f'<li data-icon="carat-r" data-race-id="{race_id}">'
+        f'<a href="#"><span class="race-list-time">01.01.25 12:00</span>'
+        f'<span class="race-list-name">{title}</span>'
+        f'<div class="race_type">Гонка TimeAttack</div></a></li>\n'
+        for race_id, title in races
+    )
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8"></head><body>'
+            f'<ul data-role="listview" id="raceListContainer">\n{items}</ul></body></html>')
+
+
+def make_races(count, seed=0):
+    """Список (race_id, название) для синтетической страницы; часть - квалификации"""
+    rnd = random.Random(seed)
+    races = []
+    for i in range(count):
+        race_id = str(uuid.UUID(int=rnd.getrandbits(128)))
+        kind = rnd.choice(["MIKS", "SHONX", "MIKS Junior"])
+        races.append((race_id, f"{kind} {i // 3 + 1} {'ABC'[i % 3]}"))
+        if i % 10 == 9:
+            races.append((str(uuid.UUID(int=rnd.getrandbits(128))), f"{kind} {i} Квалификация"))
+    return races
+
+
+class FakeRaceMann:
+    """Локальная замена miks.racemann.com, отдающая сгенерированные выгрузки"""
+
+    def __init__(self, rows=50, latency=0.0, variants=8):
+        self.latency = latency
+        # Несколько разных книг, чтобы не генерировать файл на каждый запрос
+        self.workbooks = [make_race_workbook(rows, seed) for seed in range(variants)]
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if not self.path.startswith("/DriverStat/driverslistcsv/"):
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                with fake.lock:
+                    fake.requests += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                race_id = self.path.rsplit("/", 1)[1].split("?", 1)[0]
+                # crc32, а не hash(): у str соль своя в каждом процессе, а книга гонки должна быть одной от запуска к запуску
+                body = fake.workbooks[zlib.crc32(race_id.encode()) % len(fake.workbooks)]
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", f'"{race_id}"')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def read_proc_status_mb(field):
+    """Значение поля VmRSS/VmHWM из /proc/self/status, МБ (только Linux)"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Сбрасывает пиковый RSS процесса (VmHWM), чтобы пик считался с начала этапа"""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def children_peak_rss_mb():
+    """Наибольший пиковый RSS среди завершённых дочерних процессов, МБ (только Unix)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+
+
+def measure(stage, items, func, *args, trace_memory=False, **kwargs):
+    """Выполняет этап и возвращает (результат, метрики этапа)
+
+    trace_memory=True включает tracemalloc: пик памяти Python-объектов этапа
+    точнее, но сам замер заметно замедляет код.
+    """
+    # ru_maxrss копится за всю жизнь процесса, поэтому пик этапа берётся из VmHWM
+    # после сброса, а рядом пишется прирост текущего RSS за этап
+    peak_reset = reset_peak_rss()
+    rss_before = read_proc_status_mb("VmRSS")
+    children_before = children_peak_rss_mb()
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        result = func(*args, **kwargs)
+    seconds = time.perf_counter() - started
+    rss_after = read_proc_status_mb("VmRSS")
+    children_after = children_peak_rss_mb()
+    stats = {
+        "stage": stage,
+        "items": items,
+        "seconds": round(seconds, 6),
+        "items_per_second": round(items / seconds, 3) if seconds else None,
+        "peak_rss_mb": round(read_proc_status_mb("VmHWM"), 3) if peak_reset else None,
+        "rss_delta_mb": (round(rss_after - rss_before, 3)
+                         if rss_before is not None and rss_after is not None else None),
+        # Пик дочерних процессов известен только как максимум за всё время,
+        # поэтому он пишется, лишь если вырос именно на этом этапе
+        "children_peak_rss_mb": (round(children_after, 3)
+                                 if children_after is not None and children_after > children_before
+                                 else None),
+    }
+    if trace_memory:
+        stats["peak_python_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 3)
+        tracemalloc.stop()
+    return result, stats
+
+
+def run_case(races_count, rows, latency, workers, merge_workers, workdir, trace_memory=False):
+    """Прогоняет весь конвейер на одном наборе параметров"""
+    html_file = os.path.join(workdir, "RaceMann.html")
+    download_dir = os.path.join(workdir, "miks_driverstats")
+    cache_dir = os.path.join(workdir, "cache")
+    # Кэш списка гонок тоже в рабочей папке, иначе бенчмарк затрёт кэш настоящего конвейера
+    race_index_dir = os.path.join(workdir, "race_index")
+    outputs = [os.path.join(workdir, "output3.xlsx"), os.path.join(workdir, "output3.json")]
+    with open(html_file, "w", encoding="utf-8") as f:
+        f.write(make_race_page(make_races(races_count)))
+
+    stages = []
+    with FakeRaceMann(rows=rows, latency=latency) as fake:
+        races, stats = measure("race_index", races_count, final.find_races, html_file, cache_dir=None,
+                               trace_memory=trace_memory)
+        stages.append(stats)
+
+        results, stats = measure("download", len(races), final.download_races, html_file,
+                                 fake.url, download_dir, workers=workers, cache_dir=race_index_dir,
+                                 trace_memory=trace_memory)
+        stats["bytes"] = sum(r["bytes"] for r in results)
+        stats["errors"] = sum(r["status"] != "ok" for r in results)
+        stages.append(stats)
+
+        requests_before = fake.requests
+        _, stats = measure("sync_noop", len(races), final.sync_races, html_file, fake.url,
+                           download_dir, workers=workers, cache_dir=race_index_dir,
+                           trace_memory=trace_memory)
+        # Счётчик сервера общий для всех этапов, в метрику идёт только прирост за sync
+        stats["requests"] = fake.requests - requests_before
+        stages.append(stats)
+
+    merged, stats = measure("merge", len(races), final.merge_xlsx_files, download_dir, outputs,
+                            workers=merge_workers, cache_dir=None, trace_memory=trace_memory)
+    stats["rows"] = len(merged) if merged is not None else 0
+    stages.append(stats)
+
+    merged, stats = measure("merge_cached", len(races), final.merge_xlsx_files, download_dir,
+                            outputs, workers=merge_workers, cache_dir=cache_dir,
+                            trace_memory=trace_memory)
+    stages.append(stats)
+    _, stats = measure("merge_cache_hit", len(races), final.merge_xlsx_files, download_dir,
+                       outputs, workers=merge_workers, cache_dir=cache_dir,
+                       trace_memory=trace_memory)
+    stages.append(stats)
+
+    return {
+        "races": races_count,
+        "rows_per_race": rows,
+        "latency": latency,
+        "workers": workers,
+        "merge_workers": merge_workers,
+        "stages": stages,
+        "total_seconds": round(sum(stage["seconds"] for stage in stages), 6),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк конвейера скачивания и объединения гонок")
+    parser.add_argument("--races", type=int, nargs="+", default=[10, 100, 1000],
+                        help="число гонок на странице (например 10 100 1000 10000)")
+    parser.add_argument("--rows", type=int, default=50, help="строк в файле одной гонки")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа сервера, с")
+    parser.add_argument("--workers", type=int, default=8, help="потоков скачивания")
+    parser.add_argument("--merge-workers", type=int, default=None, help="процессов объединения")
+    parser.add_argument("--output", default=None, help="куда дописать результаты (JSON Lines)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="замерять пик памяти Python через tracemalloc (медленнее)")
+    parser.add_argument("--keep", action="store_true", help="не удалять рабочие папки")
+    args = parser.parse_args(argv)
+
+    environment = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    for races_count in args.races:
+        workdir = tempfile.mkdtemp(prefix=f"bench_races_{races_count}_")
+        try:
+            result = run_case(races_count, args.rows, args.latency, args.workers,
+                              args.merge_workers, workdir, args.trace_memory)
+        finally:
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+        result["environment"] = environment
+        line = json.dumps(result, ensure_ascii=False)
+        print(line)
+        if args.output:
+            with open(args.output, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,337 @@
 import os
 import re
+import fnmatch
+import json
+import time
+import zlib
+import hashlib
+import tempfile
+import zipfile
 import xml.etree.ElementTree as ET
-from collections import Counter, defaultdict
+from html.parser import HTMLParser
+from collections import Counter, defaultdict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
 from bs4 import BeautifulSoup
 import openpyxl
 from docx import Document
 
+# Пространства имён DOCX (WordprocessingML) и ODT (OpenDocument)
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+ODT_TEXT_NS = '{urn:oasis:names:tc:opendocument:xmlns:text:1.0}'
+ODT_OFFICE_NS = '{urn:oasis:names:tc:opendocument:xmlns:office:1.0}'
+
+# Словоформа - целое слово из русских или латинских букв (как \b[а-яёa-z]+\b)
+WORD_PATTERN = re.compile(r'\b[а-яёa-z]+\b')
+NON_WORD = re.compile(r'\W')
+
+
+def unfinished_word_start(buffer):
+    """Начало незаконченного слова в конце куска текста (len(buffer), если его нет)
+
+    Последний не-буквенный символ ищется окнами по 64 символа с конца,
+    поэтому даже очень длинное «слово» (например, base64) разбирается за
+    линейное время.
+    """
+    end = len(buffer)
+    while end > 0:
+        start = max(0, end - 64)
+        last = None
+        for last in NON_WORD.finditer(buffer, start, end):
+            pass
+        if last is not None:
+            return last.end()
+        end = start
+    return 0
+
+
+class SparseVectors:
+    """Разреженная матрица документ-термин в формате CSR
+
+    Для каждого документа хранятся только ненулевые элементы: номера слов
+    (indices) и их частоты (data); indptr[i]:indptr[i + 1] - срез документа i.
+    """
+
+    def __init__(self, indptr, indices, data, n_features):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.n_features = n_features
+
+    @classmethod
+    def from_rows(cls, rows, n_features):
+        """Собирает матрицу из пар (номера слов, частоты) по документам"""
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        for i, (indices, _) in enumerate(rows):
+            indptr[i + 1] = indptr[i] + len(indices)
+        indices = np.concatenate([r[0] for r in rows]) if rows else np.empty(0)
+        data = np.concatenate([r[1] for r in rows]) if rows else np.empty(0)
+        return cls(indptr, indices.astype(np.int32), data.astype(np.int32), n_features)
+
+    @property
+    def shape(self):
+        return (len(self.indptr) - 1, self.n_features)
+
+    ARRAYS = ('indptr', 'indices', 'data')
+
+    def save(self, directory):
+        """Сохраняет матрицу в папку: массивы .npy и meta.json с шириной"""
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'n_features': int(self.n_features), 'n_documents': len(self)}, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Открывает сохранённую матрицу
+
+        mmap=True - массивы отображаются в память только для чтения: файл
+        открывается сразу, страницы читаются с диска по мере обращения, и
+        несколько процессов разделяют одни и те же страницы без копирования.
+        """
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        arrays = [np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+                  for name in cls.ARRAYS]
+        return cls(*arrays, meta['n_features'])
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def row(self, i):
+        """Ненулевые элементы документа: (номера слов, частоты)"""
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def dense_row(self, i, start=0, end=None):
+        """Плотный вектор документа длиной в словарь (или его часть start:end)"""
+        end = self.n_features if end is None else end
+        vector = np.zeros(end - start, dtype=np.int64)
+        indices, counts = self.row(i)
+        if start or end < self.n_features:
+            # Номера слов внутри документа отсортированы
+            lo, hi = np.searchsorted(indices, [start, end])
+            indices, counts = indices[lo:hi] - start, counts[lo:hi]
+        vector[indices] = counts
+        return vector
+
+    def to_dense(self):
+        """Плотное представление - список списков, как раньше возвращал create_word_vectors"""
+        return [self.dense_row(i).tolist() for i in range(len(self))]
+
+    def transpose(self):
+        """Матрица слово-документ: строка i - документы, где есть слово i"""
+        rows = np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.indptr))
+        order = np.argsort(self.indices, kind='stable')
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(self.indices, minlength=self.n_features))))
+        return SparseVectors(indptr.astype(np.int64), rows[order], self.data[order], len(self))
+
+    def row_sums(self):
+        """Сумма частот по каждому документу"""
+        cumulative = np.concatenate(([0], np.cumsum(self.data, dtype=np.int64)))
+        return cumulative[self.indptr[1:]] - cumulative[self.indptr[:-1]]
+
+    def remap(self, mapping):
+        """Матрица с номерами слов, переведёнными через mapping (старый номер -> новый)"""
+        mapping = np.asarray(mapping)
+        indptr, indices, data = remap_csr((self.indptr, self.indices, self.data), mapping)
+        return SparseVectors(indptr, indices.astype(np.int32), data, len(mapping))
+
+    @classmethod
+    def vstack(cls, matrices, n_features=None):
+        """Объединяет матрицы документов одну под другой
+
+        Матрицы, построенные до расширения словаря, остаются корректными:
+        их ширина просто дополняется до n_features (по умолчанию - наибольшей).
+        """
+        if n_features is None:
+            n_features = max((matrix.n_features for matrix in matrices), default=0)
+        return concat_csr([(m.indptr, m.indices, m.data) for m in matrices], n_features)
+
+    def column_sums(self):
+        """Сумма частот каждого слова по всем документам"""
+        return np.bincount(self.indices, weights=self.data, minlength=self.n_features).astype(np.int64)
+
+
+class DocumentAnalysis:
+    """Результат одного прохода по документу: частоты словоформ и лемм
+
+    Документ токенизируется один раз, а словарь, векторы и статистика
+    отчёта берутся из этого объекта, а не из повторной токенизации.
+    """
+
+    def __init__(self, word_counts, lemma_counts):
+        self.word_counts = word_counts
+        self.lemma_counts = lemma_counts
+        self.word_total = sum(word_counts.values())
+        self.lemma_total = sum(lemma_counts.values())
+
+    def counts(self, method='word_forms'):
+        """Частоты словоформ или лемм - в зависимости от метода"""
+        return self.word_counts if method == 'word_forms' else self.lemma_counts
+
+
+class SuffixLemmatizer:
+    """Табличная лемматизация по окончаниям с кэшем результатов
+
+    Правила проверяются в том же порядке, что и прежняя цепочка if/elif:
+    из всех подходящих окончаний слова берётся правило, стоящее раньше,
+    а если для него слишком короткая основа - следующее. Окончания собраны
+    в один словарь, поэтому на слово нужно не больше четырёх поисков по
+    длинам окончаний вместо ~20 вызовов endswith. Результаты кэшируются
+    по словоформе с вытеснением давно не использованных (LRU).
+    """
+
+    # (окончания, сколько букв отрезать, что добавить, минимальная длина основы)
+    RULES = [
+        # Правила для существительных (женский род)
+        (('ости', 'асти'), 2, 'ость', 0),
+        (('ации',), 3, 'ация', 0),
+        (('ии',), 1, '', 0),
+        # Правила для прилагательных
+        (('ого', 'его'), 3, 'ий', 0),
+        (('ым', 'им'), 2, 'ый', 0),
+        (('ой', 'ей'), 2, 'ый', 0),
+        # Правила для глаголов
+        (('ить', 'еть', 'ать'), 2, 'ь', 0),
+        (('ют', 'ут'), 2, '', 0),
+        (('ят', 'ат'), 2, '', 0),
+        (('ил', 'ел'), 2, 'ь', 0),
+        # Удаление окончаний множественного числа
+        (('ы', 'и'), 1, '', 3),
+    ]
+
+    def __init__(self, rules=None, min_length=4, cache_size=65536):
+        self.min_length = min_length
+        # окончание -> (порядок правила, отрезать, добавить, минимальная основа)
+        self.table = {}
+        for order, (suffixes, cut, add, min_base) in enumerate(rules or self.RULES):
+            for suffix in suffixes:
+                self.table.setdefault(suffix, (order, cut, add, min_base))
+        self.suffix_lengths = sorted({len(suffix) for suffix in self.table}, reverse=True)
+        self.cache_size = cache_size
+        self.lemmatize = lru_cache(maxsize=cache_size)(self.lemmatize_uncached)
+
+    def __getstate__(self):
+        # lru_cache над связанным методом не сериализуется: кэш не передаётся, а создаётся заново
+        state = self.__dict__.copy()
+        del state['lemmatize']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lemmatize = lru_cache(maxsize=self.cache_size)(self.lemmatize_uncached)
+
+    def lemmatize_uncached(self, word):
+        """Лемма одной словоформы без обращения к кэшу"""
+        if len(word) < self.min_length:
+            return word
+        matches = []
+        for length in self.suffix_lengths:
+            rule = self.table.get(word[-length:])
+            if rule is not None:
+                matches.append(rule)
+        for _, cut, add, min_base in sorted(matches):
+            base = word[:-cut]
+            if len(base) >= min_base:
+                return base + add
+        return word
+
+    def lemmatize_many(self, words):
+        """Леммы для списка словоформ: каждое различное слово обрабатывается один раз"""
+        lemmas = {word: self.lemmatize(word) for word in dict.fromkeys(words)}
+        return [lemmas[word] for word in words]
+
+
+def counts_to_csr(rows, term_index):
+    """Частоты документов (словари слово -> частота) в массивы CSR по номерам term_index"""
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    for i, counts in enumerate(rows):
+        indptr[i + 1] = indptr[i] + len(counts)
+    total = int(indptr[-1])
+    indices = np.fromiter((term_index[word] for counts in rows for word in counts),
+                          dtype=np.int32, count=total)
+    data = np.fromiter((count for counts in rows for count in counts.values()),
+                       dtype=np.int32, count=total)
+    return indptr, indices, data
+
+
+def vectorize_shard(texts, stop_words):
+    """Обработка части корпуса в отдельном процессе
+
+    Возвращает словарь части (слова через '\n': сначала словоформы в порядке
+    первого появления, затем леммы, которых нет среди словоформ), число
+    словоформ в нём и массивы CSR частот словоформ и лемм с номерами слов
+    этого локального словаря. Массивы numpy передаются между процессами
+    гораздо компактнее, чем списки Python.
+    """
+    vectorizer = DocumentVectorizer()
+    vectorizer.stop_words = stop_words
+    analyses = [vectorizer.analyze(text) for text in texts]
+
+    terms = {}
+    for analysis in analyses:
+        for word in analysis.word_counts:
+            terms.setdefault(word, len(terms))
+    n_words = len(terms)
+    for analysis in analyses:
+        for lemma in analysis.lemma_counts:
+            terms.setdefault(lemma, len(terms))
+
+    word_csr = counts_to_csr([analysis.word_counts for analysis in analyses], terms)
+    lemma_csr = counts_to_csr([analysis.lemma_counts for analysis in analyses], terms)
+    return '\n'.join(terms), n_words, word_csr, lemma_csr
+
+
+def remap_csr(csr, remap):
+    """Переводит номера слов CSR через массив remap и сортирует их внутри документов"""
+    indptr, indices, data = csr
+    indices = remap[indices]
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    order = np.lexsort((indices, rows))
+    return indptr, indices[order], data[order]
+
+
+def concat_csr(parts, n_features):
+    """Склеивает CSR частей корпуса (в порядке документов) в одну матрицу"""
+    indptrs = [np.zeros(1, dtype=np.int64)]
+    offset = 0
+    for indptr, indices, _ in parts:
+        indptrs.append(indptr[1:] + offset)
+        offset += len(indices)
+    indices = np.concatenate([part[1] for part in parts]) if parts else np.empty(0)
+    data = np.concatenate([part[2] for part in parts]) if parts else np.empty(0)
+    return SparseVectors(np.concatenate(indptrs), indices.astype(np.int32),
+                         data.astype(np.int32), n_features)
+
+
 class DocumentVectorizer:
-    def __init__(self):
+    """Векторизация документов по словоформам или леммам
+
+    mode='vocabulary' - номер слова берётся из словаря, построенного по
+    корпусу (build_vocabulary). mode='hashing' - словарь не нужен: слово
+    попадает в одну из n_features корзин по стабильному хешу (CRC32 от
+    UTF-8), так что векторы строятся за один проход, ширина не растёт с
+    корпусом, а векторы разных партий и машин сравнимы напрямую. Для показа
+    слов в хеш-режиме хранится не больше reverse_map_size пар «корзина -
+    первое попавшее в неё слово».
+    """
+
+    MODES = ('vocabulary', 'hashing')
+    BUCKET_CACHE_SIZE = 65536
+
+    def __init__(self, mode='vocabulary', n_features=2 ** 18, reverse_map_size=65536):
+        if mode not in self.MODES:
+            raise ValueError(f"Неизвестный режим векторизации: {mode}")
+        self.mode = mode
+        self.hash_size = n_features
+        self.reverse_map_size = reverse_map_size
+        self.reverse_map = {}
+        self.bucket = lru_cache(maxsize=self.BUCKET_CACHE_SIZE)(self.bucket_uncached)
+        self.lemmatizer = SuffixLemmatizer()
         self.vocabulary = set()
         self.word_to_index = {}
         self.index_to_word = {}
@@ -30,240 +354,1355 @@ class DocumentVectorizer:
             'перед', 'иногда', 'лучше', 'чуть', 'том', 'нельзя', 'такой', 'им', 
             'более', 'всегда', 'конечно', 'всю', 'между'
         }
-        
+
+    def __getstate__(self):
+        # Кэш корзин не сериализуется (lru_cache над связанным методом) и создаётся заново;
+        # reverse_map передаётся как есть, а повторное заполнение через setdefault его не меняет
+        state = self.__dict__.copy()
+        del state['bucket']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.bucket = lru_cache(maxsize=self.BUCKET_CACHE_SIZE)(self.bucket_uncached)
+
+    def save(self, path):
+        """Сохраняет настройки и словарь векторизатора в JSON"""
+        state = {
+            'mode': self.mode,
+            'n_features': self.hash_size,
+            'reverse_map_size': self.reverse_map_size,
+            'reverse_map': {str(idx): word for idx, word in self.reverse_map.items()},
+            'stop_words': sorted(self.stop_words),
+            # Слова по порядку номеров: номер слова - его позиция в списке
+            'words': [self.index_to_word[idx] for idx in range(len(self.index_to_word))],
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        """Загружает векторизатор, сохранённый методом save"""
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        vectorizer = cls(state['mode'], state['n_features'], state['reverse_map_size'])
+        vectorizer.reverse_map = {int(idx): word for idx, word in state['reverse_map'].items()}
+        vectorizer.stop_words = set(state['stop_words'])
+        vectorizer.word_to_index = {word: idx for idx, word in enumerate(state['words'])}
+        vectorizer.index_to_word = dict(enumerate(state['words']))
+        vectorizer.vocabulary = set(state['words'])
+        return vectorizer
+
+    @property
+    def n_features(self):
+        """Длина вектора документа: размер словаря или число корзин хеша"""
+        return self.hash_size if self.mode == 'hashing' else len(self.vocabulary)
+
+    def feature_name(self, idx):
+        """Слово, соответствующее номеру в векторе"""
+        if self.mode == 'hashing':
+            return self.reverse_map.get(idx, f'#{idx}')
+        return self.index_to_word[idx]
+
+    def bucket_uncached(self, word):
+        """Номер корзины слова в хеш-режиме"""
+        idx = zlib.crc32(word.encode('utf-8')) % self.hash_size
+        if len(self.reverse_map) < self.reverse_map_size:
+            self.reverse_map.setdefault(idx, word)
+        return idx
+
     def extract_word_forms(self, text):
         """Извлечение словоформ (токенизация с сохранением исходных форм)"""
-        # Приведение к нижнему регистру и разделение на слова
-        words = re.findall(r'\b[а-яёa-z]+\b', text.lower())
-        # Удаление стоп-слов
-        words = [word for word in words if word not in self.stop_words and len(word) > 2]
-        return words
+        return list(self.iter_word_forms(text))
+
+    def iter_word_forms(self, chunks):
+        """Потоковая токенизация: словоформы по мере чтения текста
+
+        chunks - строка или итерируемый набор кусков текста (например, блоки
+        файла). Каждый кусок приводится к нижнему регистру отдельно; слово,
+        разрезанное границей кусков, откладывается до следующего куска,
+        поэтому результат совпадает с токенизацией всего текста целиком.
+        """
+        if isinstance(chunks, str):
+            chunks = (chunks,)
+        tail = ''
+        for chunk in chunks:
+            buffer = tail + chunk.lower()
+            # Всё до начала незаконченного слова в конце куска уже не может продолжиться
+            boundary = unfinished_word_start(buffer)
+            tail = buffer[boundary:]
+            if boundary:
+                yield from self.filter_words(WORD_PATTERN.findall(buffer, 0, boundary))
+        if tail:
+            yield from self.filter_words(WORD_PATTERN.findall(tail))
+
+    def filter_words(self, words):
+        """Удаление стоп-слов и слов короче трёх букв"""
+        stop_words = self.stop_words
+        return [word for word in words if word not in stop_words and len(word) > 2]
     
     def extract_lemma_forms(self, text):
         """Извлечение начальных форм слов (простая лемматизация)"""
         words = self.extract_word_forms(text)
-        lemmas = []
-        
-        for word in words:
-            lemma = self.simple_lemmatize(word)
-            lemmas.append(lemma)
-            
-        return lemmas
+        return self.lemmatizer.lemmatize_many(words)
     
     def simple_lemmatize(self, word):
         """Простая лемматизация для русского языка"""
-        if len(word) <= 3:
-            return word
-            
-        # Правила для существительных (женский род)
-        if word.endswith('ости') or word.endswith('асти'):
-            return word[:-2] + 'ость'
-        elif word.endswith('ации'):
-            return word[:-3] + 'ация'
-        elif word.endswith('ии'):
-            return word[:-1]
-            
-        # Правила для прилагательных
-        if word.endswith('ого') or word.endswith('его'):
-            return word[:-3] + 'ий'
-        elif word.endswith('ым') or word.endswith('им'):
-            return word[:-2] + 'ый'
-        elif word.endswith('ой') or word.endswith('ей'):
-            return word[:-2] + 'ый'
-            
-        # Правила для глаголов
-        if word.endswith('ить') or word.endswith('еть') or word.endswith('ать'):
-            return word[:-2] + 'ь'
-        elif word.endswith('ют') or word.endswith('ут'):
-            return word[:-2]
-        elif word.endswith('ят') or word.endswith('ат'):
-            return word[:-2]
-        elif word.endswith('ил') or word.endswith('ел'):
-            return word[:-2] + 'ь'
-            
-        # Удаление окончаний множественного числа
-        if word.endswith('ы') or word.endswith('и'):
-            base = word[:-1]
-            if len(base) > 2:
-                return base
-                
-        return word
+        return self.lemmatizer.lemmatize(word)
     
+    def analyze(self, text):
+        """Один проход по документу: словоформы, их леммы и частоты
+
+        text - строка или итерируемый набор кусков текста: в памяти
+        держатся только частоты различных слов, а не весь документ.
+        """
+        word_counts = Counter(self.iter_word_forms(text))
+        lemma_counts = Counter()
+        # Лемма зависит только от словоформы, поэтому достаточно обойти различные слова
+        for word, count in word_counts.items():
+            lemma_counts[self.simple_lemmatize(word)] += count
+        return DocumentAnalysis(word_counts, lemma_counts)
+
+    def analyze_documents(self, documents):
+        """Анализ документов; уже готовые DocumentAnalysis не пересчитываются"""
+        return [doc if isinstance(doc, DocumentAnalysis) else self.analyze(doc) for doc in documents]
+
     def build_vocabulary(self, documents):
-        """Построение словаря из всех документов"""
-        all_words = []
-        for doc in documents:
-            all_words.extend(self.extract_word_forms(doc))
-            all_words.extend(self.extract_lemma_forms(doc))
+        """Построение словаря из всех документов (тексты или DocumentAnalysis)"""
+        if self.mode == 'hashing':
+            # В хеш-режиме словарь не нужен
+            return
+        all_words = set()
+        for analysis in self.analyze_documents(documents):
+            all_words.update(analysis.word_counts)
+            all_words.update(analysis.lemma_counts)
         
-        self.vocabulary = set(all_words)
+        self.vocabulary = all_words
         self.word_to_index = {word: idx for idx, word in enumerate(sorted(self.vocabulary))}
         self.index_to_word = {idx: word for word, idx in self.word_to_index.items()}
     
-    def create_word_vectors(self, documents, method='word_forms'):
-        """Создание векторов документов"""
-        vectors = []
-        
-        for doc in documents:
-            if method == 'word_forms':
-                words = self.extract_word_forms(doc)
-            else:  # lemma_forms
-                words = self.extract_lemma_forms(doc)
-            
-            # Создание вектора частот слов
-            vector = [0] * len(self.vocabulary)
-            word_counts = Counter(words)
-            
+    def vector(self, document, method='word_forms'):
+        """Ненулевые элементы вектора одного документа: (номера, частоты) по возрастанию номеров"""
+        analysis = document if isinstance(document, DocumentAnalysis) else self.analyze(document)
+        word_counts = analysis.counts(method)
+        if self.mode == 'hashing':
+            buckets = Counter()
             for word, count in word_counts.items():
-                if word in self.word_to_index:
-                    vector[self.word_to_index[word]] = count
-            
-            vectors.append(vector)
-        
-        return vectors
+                buckets[self.bucket(word)] += count
+            pairs = sorted(buckets.items())
+        else:
+            pairs = sorted(
+                (self.word_to_index[word], count)
+                for word, count in word_counts.items()
+                if word in self.word_to_index
+            )
+        indices = np.fromiter((idx for idx, _ in pairs), dtype=np.int32, count=len(pairs))
+        counts = np.fromiter((count for _, count in pairs), dtype=np.int32, count=len(pairs))
+        return indices, counts
+
+    def iter_vectors(self, documents, method='word_forms'):
+        """Потоковая векторизация: векторы по одному документу по мере чтения
+
+        В хеш-режиме не требует словаря, и в памяти держится только
+        текущий документ.
+        """
+        for document in documents:
+            yield self.vector(document, method)
+
+    def create_word_vectors(self, documents, method='word_forms', dense=False):
+        """Создание векторов документов
+
+        documents - тексты или DocumentAnalysis. По умолчанию возвращает
+        разреженную матрицу SparseVectors; dense=True возвращает прежний
+        список плотных списков длиной в словарь.
+        """
+        rows = list(self.iter_vectors(documents, method))
+        vectors = SparseVectors.from_rows(rows, self.n_features)
+        return vectors.to_dense() if dense else vectors
+
+    def partial_fit(self, documents):
+        """Добавление новых документов без перестройки словаря
+
+        Новые слова получают номера в конце словаря (в алфавитном порядке
+        внутри партии), номера уже известных слов не меняются, поэтому ранее
+        созданные векторы остаются верными. Векторизуются только новые
+        документы; возвращает (векторы словоформ, векторы лемм) для них.
+        Вернуть словарю алфавитный порядок можно методом compact.
+        """
+        analyses = self.analyze_documents(documents)
+        new_words = set()
+        for analysis in analyses:
+            new_words.update(word for word in analysis.word_counts if word not in self.word_to_index)
+            new_words.update(word for word in analysis.lemma_counts if word not in self.word_to_index)
+
+        if self.mode == 'hashing':
+            # Номера слов задаёт хеш, словарь расширять не нужно
+            new_words = set()
+        for word in sorted(new_words):
+            idx = len(self.word_to_index)
+            self.word_to_index[word] = idx
+            self.index_to_word[idx] = word
+        self.vocabulary.update(new_words)
+
+        word_vectors = self.create_word_vectors(analyses, 'word_forms')
+        lemma_vectors = self.create_word_vectors(analyses, 'lemma_forms')
+        return word_vectors, lemma_vectors
+
+    def compact(self):
+        """Пересортировка словаря после partial_fit
+
+        Возвращает массив «старый номер -> новый»; существующие векторы
+        переводятся на новый словарь через SparseVectors.remap.
+        """
+        mapping = np.empty(len(self.word_to_index), dtype=np.int32)
+        for idx, word in enumerate(sorted(self.word_to_index)):
+            mapping[self.word_to_index[word]] = idx
+        self.word_to_index = {word: int(mapping[idx]) for word, idx in self.word_to_index.items()}
+        self.index_to_word = {idx: word for word, idx in self.word_to_index.items()}
+        return mapping
+
+    def fit_transform(self, documents, workers=None, shards=None):
+        """Словарь и векторы словоформ и лемм по корпусу на нескольких процессах
+
+        Документы делятся на последовательные части; каждый процесс
+        токенизирует, лемматизирует и считает частоты своей части
+        (vectorize_shard), после чего локальные словари объединяются в тот же
+        отсортированный word_to_index, что строит build_vocabulary, а номера
+        слов переводятся на него. Результат побайтно совпадает с
+        build_vocabulary + create_word_vectors.
+
+        Возвращает (векторы словоформ, векторы лемм, словоформы в порядке
+        первого появления в корпусе) - последнее нужно отчёту, чтобы топ слов
+        с равными частотами шёл в том же порядке, что и у Counter.
+        """
+        if self.mode == 'hashing':
+            raise ValueError("fit_transform строит словарь; в хеш-режиме используйте create_word_vectors")
+        documents = list(documents)
+        workers = workers or os.cpu_count() or 1
+        shards = shards or min(len(documents), workers * 4) or 1
+        bounds = np.linspace(0, len(documents), shards + 1).astype(int)
+        parts = [documents[bounds[i]:bounds[i + 1]] for i in range(shards)]
+        stop_words = [self.stop_words] * shards
+
+        if workers == 1:
+            results = list(map(vectorize_shard, parts, stop_words))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(vectorize_shard, parts, stop_words))
+
+        shard_terms = [terms.split('\n') if terms else [] for terms, _, _, _ in results]
+        word_order = list(dict.fromkeys(
+            word
+            for terms, (_, n_words, _, _) in zip(shard_terms, results)
+            for word in terms[:n_words]
+        ))
+        self.vocabulary = set().union(*shard_terms)
+        self.word_to_index = {word: idx for idx, word in enumerate(sorted(self.vocabulary))}
+        self.index_to_word = {idx: word for word, idx in self.word_to_index.items()}
+
+        word_parts, lemma_parts = [], []
+        for terms, (_, _, word_csr, lemma_csr) in zip(shard_terms, results):
+            remap = np.fromiter((self.word_to_index[word] for word in terms),
+                                dtype=np.int32, count=len(terms))
+            word_parts.append(remap_csr(word_csr, remap))
+            lemma_parts.append(remap_csr(lemma_csr, remap))
+
+        n_features = len(self.vocabulary)
+        return concat_csr(word_parts, n_features), concat_csr(lemma_parts, n_features), word_order
+
+class DocumentIndex:
+    """Поиск похожих документов по косинусной мере над векторами документов
+
+    Частоты взвешиваются TF-IDF (сглаженный idf = ln((1 + N) / (1 + df)) + 1)
+    и нормируются по L2 - всё целиком на массивах numpy. Для поиска строится
+    инвертированный индекс: для каждого слова - документы, где оно есть, и
+    их веса. Запрос оценивает только документы, у которых есть хотя бы одно
+    общее с ним слово, а не весь корпус.
+    """
+
+    def __init__(self, vectorizer, vectors, document_names=None, method='word_forms',
+                 tfidf=True, normalize=True):
+        self.vectorizer = vectorizer
+        self.method = method
+        self.normalize = normalize
+        self.n_documents, self.n_features = vectors.shape
+        self.document_names = list(document_names) if document_names is not None else list(range(self.n_documents))
+        self.name_to_document = {name: i for i, name in enumerate(self.document_names)}
+
+        indices = vectors.indices
+        rows = np.repeat(np.arange(self.n_documents), np.diff(vectors.indptr))
+        weights = vectors.data.astype(np.float64)
+        if tfidf:
+            document_frequency = np.bincount(indices, minlength=self.n_features)
+            self.idf = np.log((1 + self.n_documents) / (1 + document_frequency)) + 1
+            weights *= self.idf[indices]
+        else:
+            self.idf = None
+        if normalize:
+            norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=self.n_documents))
+            weights /= np.where(norms > 0, norms, 1)[rows]
+        self.indptr = vectors.indptr
+        self.indices = indices
+        self.weights = weights
+
+        # Инвертированный индекс: postings_ptr[t]:postings_ptr[t + 1] - документы слова t
+        order = np.argsort(indices, kind='stable')
+        self.postings_ptr = np.searchsorted(indices[order], np.arange(self.n_features + 1))
+        self.postings_documents = rows[order].astype(np.int32)
+        self.postings_weights = weights[order]
+
+    def postings(self, term_index):
+        """Документы, в которых есть слово, и веса слова в них"""
+        start, end = self.postings_ptr[term_index], self.postings_ptr[term_index + 1]
+        return self.postings_documents[start:end], self.postings_weights[start:end]
+
+    def query_weights(self, indices, counts):
+        """Взвешивание запроса так же, как документов"""
+        weights = np.asarray(counts, dtype=np.float64)
+        if self.idf is not None:
+            weights = weights * self.idf[indices]
+        if self.normalize:
+            norm = np.sqrt(np.dot(weights, weights))
+            if norm > 0:
+                weights = weights / norm
+        return weights
+
+    def query_vector(self, query):
+        """Номера слов и частоты запроса: текст или имя документа индекса"""
+        document = self.name_to_document.get(query)
+        if document is not None:
+            start, end = self.indptr[document], self.indptr[document + 1]
+            return self.indices[start:end], self.weights[start:end], document
+        indices, counts = self.vectorizer.vector(query, self.method)
+        # Слова, добавленные в словарь после построения индекса, не учитываются
+        known = indices < self.n_features
+        indices, counts = indices[known], counts[known]
+        return indices, self.query_weights(indices, counts), None
+
+    def search(self, query, k=10):
+        """Топ-k документов, похожих на запрос (текст или имя документа)
+
+        Возвращает список пар (имя документа, сходство) по убыванию
+        сходства; сам документ-запрос в выдачу не попадает.
+        """
+        indices, weights, exclude = self.query_vector(query)
+        return self.search_vector(indices, weights, k, exclude)
+
+    def search_vector(self, indices, weights, k=10, exclude=None):
+        """Топ-k документов для уже взвешенного запроса (номера слов и веса)"""
+        if not len(indices) or k <= 0:
+            return []
+        # Накопление сходства по спискам документов слов запроса: в каждом
+        # списке документ встречается один раз, поэтому хватает scores[docs] +=
+        scores = np.zeros(self.n_documents)
+        touched = np.zeros(self.n_documents, dtype=bool)
+        for term_index, weight in zip(indices, weights):
+            documents, term_weights = self.postings(term_index)
+            scores[documents] += weight * term_weights
+            touched[documents] = True
+        candidates = np.flatnonzero(touched)
+        scores = scores[candidates]
+        if exclude is not None:
+            keep = candidates != exclude
+            candidates, scores = candidates[keep], scores[keep]
+        k = min(k, len(candidates))
+        if k == 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.lexsort((candidates[best], -scores[best]))]
+        return [(self.document_names[candidates[i]], float(scores[i])) for i in best]
+
+
+# Текстовые эквиваленты элементов внутри w:r (как Run.text в python-docx)
+DOCX_RUN_SYMBOLS = {
+    W_NS + 'tab': '\t',
+    W_NS + 'ptab': '\t',
+    W_NS + 'cr': '\n',
+    W_NS + 'noBreakHyphen': '-',
+}
+# Пути от w:body до w:r, текст которых входит в Paragraph.text
+DOCX_RUN_PATHS = {
+    (W_NS + 'body', W_NS + 'p', W_NS + 'r'),
+    (W_NS + 'body', W_NS + 'p', W_NS + 'hyperlink', W_NS + 'r'),
+}
+
+
+def iter_docx_paragraphs(file_path):
+    """Тексты абзацев DOCX прямо из word/document.xml в архиве
+
+    Разбор потоковый (iterparse), без объектной модели python-docx:
+    запоминаются только текстовые узлы текущего абзаца, а обработанные
+    элементы верхнего уровня очищаются. Текст совпадает с
+    Document(file_path).paragraphs[i].text: абзацы верхнего уровня w:body,
+    прогоны w:r (в том числе внутри w:hyperlink), w:t, табуляции и разрывы
+    строк.
+    """
+    body_path = [W_NS + 'document', W_NS + 'body']
+    with zipfile.ZipFile(file_path) as archive, archive.open('word/document.xml') as f:
+        path = []
+        parts = []
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                path.append(elem.tag)
+                continue
+            path.pop()
+            tag = elem.tag
+            if path == body_path:
+                # Закончился элемент верхнего уровня: абзац, таблица, sectPr...
+                if tag == W_NS + 'p':
+                    yield ''.join(parts)
+                    parts = []
+                elem.clear()
+            elif path and path[-1] == W_NS + 'r' and tuple(path[1:]) in DOCX_RUN_PATHS:
+                if tag == W_NS + 't':
+                    parts.append(elem.text or '')
+                elif tag == W_NS + 'br':
+                    # Разрыв страницы или колонки текста не даёт
+                    if elem.get(W_NS + 'type', 'textWrapping') == 'textWrapping':
+                        parts.append('\n')
+                elif tag in DOCX_RUN_SYMBOLS:
+                    parts.append(DOCX_RUN_SYMBOLS[tag])
+
+
+def odt_element_text(elem):
+    """Текст элемента ODT с учётом text:s, text:tab и text:line-break"""
+    parts = [elem.text or '']
+    for child in elem:
+        tag = child.tag
+        if tag == ODT_TEXT_NS + 's':
+            parts.append(' ' * int(child.get(ODT_TEXT_NS + 'c', 1)))
+        elif tag == ODT_TEXT_NS + 'tab':
+            parts.append('\t')
+        elif tag == ODT_TEXT_NS + 'line-break':
+            parts.append('\n')
+        elif tag not in (ODT_TEXT_NS + 'note', ODT_OFFICE_NS + 'annotation'):
+            # Сноски и примечания в текст абзаца не входят
+            parts.append(odt_element_text(child))
+        parts.append(child.tail or '')
+    return ''.join(parts)
+
+
+def iter_odt_paragraphs(file_path):
+    """Тексты абзацев и заголовков (text:p, text:h) ODT из content.xml в архиве
+
+    Разбор потоковый: каждый абзац верхнего уровня (в том числе в списках и
+    таблицах) превращается в строку и сразу очищается.
+    """
+    paragraph_tags = (ODT_TEXT_NS + 'p', ODT_TEXT_NS + 'h')
+    with zipfile.ZipFile(file_path) as archive, archive.open('content.xml') as f:
+        depth = 0
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if elem.tag not in paragraph_tags:
+                continue
+            if event == 'start':
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 0:
+                yield odt_element_text(elem)
+                elem.clear()
+
+
+def join_paragraphs(paragraphs):
+    """Склеивает абзацы через перевод строки, обрезая пробелы и пропуская пустые"""
+    return '\n'.join(paragraph.strip() for paragraph in paragraphs if paragraph.strip())
+
+
+def detect_encoding(head):
+    """Кодировка текста по первым байтам файла: BOM, затем UTF-8, иначе cp1251"""
+    if head.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    if head.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return 'utf-16'
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # Начало файла могло оборвать многобайтовый символ на последних байтах
+        if e.start < len(head) - 3:
+            return 'cp1251'
+    return 'utf-8'
+
+
+def iter_text_chunks(file_path, chunk_size=1 << 20, encoding=None):
+    """Потоковое чтение текстового файла кусками по chunk_size символов
+
+    encoding=None - кодировка определяется по началу файла (detect_encoding).
+    """
+    if encoding is None:
+        with open(file_path, 'rb') as f:
+            encoding = detect_encoding(f.read(4096))
+    with open(file_path, 'r', encoding=encoding) as f:
+        for chunk in iter(lambda: f.read(chunk_size), ''):
+            yield chunk
+
+
+class HTMLTextExtractor(HTMLParser):
+    """Текст HTML без тегов: содержимое script/style пропускается, блочные теги дают перевод строки"""
+
+    SKIP_TAGS = {'script', 'style', 'noscript', 'template'}
+    BLOCK_TAGS = {
+        'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'figcaption',
+        'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol',
+        'p', 'pre', 'section', 'table', 'td', 'th', 'title', 'tr', 'ul',
+    }
 
-class DataProcessor:
     def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+
+def iter_element_parts(root, with_tail=True):
+    """Непустые text и tail элементов поддерева в порядке чтения документа
+
+    У каждого элемента сначала его text, затем дочерние элементы, затем tail.
+    with_tail=False - без tail самого root: он лежит уже за пределами элемента.
+    """
+    stack = [(root, False)]
+    while stack:
+        elem, closed = stack.pop()
+        if closed:
+            if (with_tail or elem is not root) and elem.tail and elem.tail.strip():
+                yield elem.tail.strip()
+            continue
+        if elem.text and elem.text.strip():
+            yield elem.text.strip()
+        stack.append((elem, True))
+        stack.extend((child, False) for child in reversed(elem))
+
+
+def parse_xml_text(root):
+    """Текст XML-дерева: text и tail всех элементов в порядке чтения через пробел"""
+    return ' '.join(iter_element_parts(root))
+
+
+def iter_xml_parts(source):
+    """Куски текста XML-файла в том же порядке, что и parse_xml_text, без построения всего дерева
+
+    Файл разбирается потоково (iterparse), и каждый кусок отдаётся, как
+    только становится известен: text элемента - при начале первого дочернего
+    элемента или при конце самого элемента, tail - при начале следующего
+    соседа или при конце родителя. Тогда же закрытый элемент удаляется из
+    дерева, поэтому в памяти держатся только открытые элементы и по одному
+    закрытому на каждом уровне, при любой вложенности обёрток.
+    """
+    # Открытые элементы: [элемент, отдан ли text, закрытый дочерний элемент без tail]
+    stack = []
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if stack:
+                # К началу элемента text родителя и tail предыдущего соседа уже разобраны
+                parent = stack[-1]
+                if not parent[1]:
+                    parent[1] = True
+                    if parent[0].text and parent[0].text.strip():
+                        yield parent[0].text.strip()
+                if parent[2] is not None:
+                    if parent[2].tail and parent[2].tail.strip():
+                        yield parent[2].tail.strip()
+                    parent[0].remove(parent[2])
+                    parent[2] = None
+            stack.append([elem, False, None])
+            continue
+        _, text_done, last = stack.pop()
+        if not text_done and elem.text and elem.text.strip():
+            yield elem.text.strip()
+        if last is not None:
+            if last.tail and last.tail.strip():
+                yield last.tail.strip()
+            elem.remove(last)
+        if stack:
+            stack[-1][2] = elem
+        elif elem.tail and elem.tail.strip():
+            yield elem.tail.strip()
+
+
+def iter_xml_records(source, record_tag):
+    """Тексты записей XML-файла: по одному на каждый элемент record_tag
+
+    record_tag - имя элемента (с пространством имён {uri}name или без него).
+    Текст записи - text и tail её поддерева по порядку, без tail самой
+    записи. Вложенные записи входят во внешнюю. Отданные записи и элементы
+    вне записей сразу удаляются из дерева, поэтому память не растёт с
+    размером файла.
+    """
+    stack = []
+    inside = 0
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        is_record = elem.tag == record_tag or elem.tag.rsplit('}', 1)[-1] == record_tag
+        if event == 'start':
+            stack.append(elem)
+            if is_record:
+                inside += 1
+            continue
+        stack.pop()
+        if is_record:
+            inside -= 1
+            if inside == 0:
+                yield ' '.join(iter_element_parts(elem, with_tail=False))
+        if not inside and stack:
+            stack[-1].remove(elem)
+
+
+def join_parts_in_chunks(parts, chunk_size=1 << 16):
+    """Склеивает куски текста через пробел в блоки примерно по chunk_size символов
+
+    Токенизатору выгоднее получать крупные блоки, чем тысячи мелких строк.
+    """
+    buffer = []
+    size = 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part) + 1
+        if size >= chunk_size:
+            yield ' '.join(buffer) + ' '
+            buffer = []
+            size = 0
+    if buffer:
+        yield ' '.join(buffer)
+
+
+def read_xml_records(file_path, record_tag):
+    """Непустые тексты записей XML-файла (iter_xml_records) одним списком
+
+    Список держит в памяти все записи; iter_dataset с xml_record_tag
+    отдаёт записи по одной прямо из iter_xml_records.
+    """
+    return [text for text in iter_xml_records(file_path, record_tag) if text]
+
+
+# Реестр форматов: расширение -> (название формата, функция чтения файла в текст)
+READERS = {}
+# Проверки содержимого для файлов без расширения: (проверка, расширение)
+SNIFFERS = []
+
+
+def register_reader(name, *extensions, sniff=None):
+    """Регистрирует функцию чтения формата
+
+    Функция получает путь к файлу и возвращает текст (ошибки - исключениями).
+    sniff(head, file_path) - необязательная проверка первых байтов файла,
+    по которой формат узнаётся у файлов без расширения. Новый формат
+    добавляется только регистрацией, process_dataset менять не нужно.
+    """
+    def decorator(func):
+        for extension in extensions:
+            READERS[extension] = (name, func)
+        if sniff is not None:
+            SNIFFERS.append((sniff, extensions[0]))
+        return func
+    return decorator
+
+
+def sniff_format(file_path, size=4096):
+    """Расширение формата по содержимому файла или None"""
+    with open(file_path, 'rb') as f:
+        head = f.read(size)
+    for check, extension in SNIFFERS:
+        if check(head, file_path):
+            return extension
+    return None
+
+
+def reader_for(file_path):
+    """(название формата, функция чтения) по расширению файла; файлы без расширения распознаются по содержимому"""
+    extension = os.path.splitext(file_path)[1].lower()
+    if not extension:
+        extension = sniff_format(file_path)
+    return READERS.get(extension)
+
+
+def is_zip_with(head, file_path, member):
+    if not head.startswith(b'PK\x03\x04'):
+        return False
+    # Сигнатура ZIP ещё не значит, что архив целый: битый файл просто не DOCX
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            return member in archive.namelist()
+    except zipfile.BadZipFile:
+        return False
+
+
+def markup_start(head):
+    """Начало файла без BOM и пробелов, в нижнем регистре"""
+    return head.lstrip(b'\xef\xbb\xbf').lstrip().lower()
+
+
+@register_reader('DOCX', '.docx', sniff=lambda head, path: is_zip_with(head, path, 'word/document.xml'))
+def read_docx_text(file_path):
+    return join_paragraphs(iter_docx_paragraphs(file_path))
+
+
+@register_reader('ODT', '.odt', sniff=lambda head, path: head.startswith(b'PK\x03\x04')
+                 and b'application/vnd.oasis.opendocument.text' in head)
+def read_odt_text(file_path):
+    return join_paragraphs(iter_odt_paragraphs(file_path))
+
+
+@register_reader('HTML', '.html', '.htm', sniff=lambda head, path: markup_start(head).startswith(b'<!doctype html')
+                 or b'<html' in markup_start(head))
+def read_html_text(file_path, chunk_size=1 << 20):
+    """Текст HTML-файла: разбор по кускам, без построения дерева документа"""
+    extractor = HTMLTextExtractor()
+    for chunk in iter_text_chunks(file_path, chunk_size):
+        extractor.feed(chunk)
+    extractor.close()
+    return join_paragraphs(''.join(extractor.parts).split('\n'))
+
+
+@register_reader('XML', '.xml', sniff=lambda head, path: markup_start(head).startswith(b'<'))
+def read_xml_text(file_path):
+    return ' '.join(iter_xml_parts(file_path))
+
+
+@register_reader('TXT', '.txt', sniff=lambda head, path: b'\x00' not in head)
+def read_txt_text(file_path):
+    return ''.join(iter_text_chunks(file_path))
+
+
+# Ошибка чтения одного файла набора данных
+ReadError = namedtuple('ReadError', ['path', 'format', 'error_type', 'message'])
+
+
+def read_document(file_path):
+    """Чтение одного файла через реестр форматов, без печати ошибок
+
+    Возвращает (текст, ошибка): текст None - формат не поддерживается,
+    ошибка - ReadError или None. Функция модульная, поэтому годится для
+    пула процессов.
+    """
+    try:
+        reader = reader_for(file_path)
+    except Exception as e:
+        return None, ReadError(file_path, None, type(e).__name__, str(e))
+    if reader is None:
+        return None, None
+    name, read = reader
+    try:
+        return read(file_path), None
+    except Exception as e:
+        return "", ReadError(file_path, name, type(e).__name__, str(e))
+
+
+def is_xml_file(file_path):
+    """Читается ли файл как XML (по расширению или содержимому); при ошибке определения формата - нет"""
+    try:
+        reader = reader_for(file_path)
+    except Exception:
+        return False
+    return reader is not None and reader[1] is read_xml_text
+
+
+def is_xml_file(file_path):
+    """Читается ли файл как XML (по расширению или содержимому); при ошибке определения формата - нет"""
+    try:
+        reader = reader_for(file_path)
+    except Exception:
+        return False
+    return reader is not None and reader[1] is read_xml_text
+
+
+def file_sha256(file_path):
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(sha256, format_name):
+    """Ключ текста в кэше: текст зависит и от содержимого, и от формата, которым файл прочитан"""
+    return f"{sha256}-{format_name.lower()}"
+
+
+def cache_blob_path(cache_dir, key):
+    """Файл кэша с текстом документа: <cache_dir>/<2 символа ключа>/<ключ>.blob
+
+    Расширение не входит в READERS, чтобы кэш внутри папки набора данных не читался как документы.
+    """
+    return os.path.join(cache_dir, key[:2], key + '.blob')
+
+
+def read_cached_blob(cache_dir, key):
+    """Текст из кэша по ключу или None, если записи нет"""
+    try:
+        with open(cache_blob_path(cache_dir, key), 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def read_document_cached(job):
+    """read_document через кэш извлечённого текста по хэшу содержимого и формату
+
+    job - (путь, папка кэша, ключ из индекса или None). Если индекс уже
+    знает ключ (совпали mtime и размер), текст сразу читается из кэша; иначе
+    SHA-256 файла считается один раз, и только если текста с ключом
+    (хэш, формат) в кэше нет, файл разбирается и текст записывается в кэш.
+    Возвращает (текст, ошибка, ключ, взят ли текст из кэша).
+    """
+    file_path, cache_dir, known_key = job
+    if known_key is not None:
+        text = read_cached_blob(cache_dir, known_key)
+        if text is not None:
+            return text, None, known_key, True
+
+    try:
+        reader = reader_for(file_path)
+        if reader is None:
+            return None, None, None, False
+        key = cache_key(file_sha256(file_path), reader[0])
+    except Exception as e:
+        return None, ReadError(file_path, None, type(e).__name__, str(e)), None, False
+    if key != known_key:
+        text = read_cached_blob(cache_dir, key)
+        if text is not None:
+            return text, None, key, True
+
+    text, error = read_document(file_path)
+    if error is None and text is not None:
+        try:
+            write_cached_blob(cache_dir, key, text)
+        except OSError:
+            # Текст уже прочитан: без записи в кэш файл просто не попадёт в индекс
+            key = None
+    return text, error, key, False
+
+
+def write_cached_blob(cache_dir, key, text):
+    """Атомарно записывает текст в кэш
+
+    Временный файл уникален (mkstemp), поэтому одинаковые файлы, которые
+    пишутся одновременно из потоков или процессов, не мешают друг другу:
+    последний os.replace просто оставляет тот же текст.
+    """
+    blob_path = cache_blob_path(cache_dir, key)
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, blob_path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class ExtractionCache:
+    """Дисковый кэш извлечённого из документов текста
+
+    Текст хранится по SHA-256 содержимого файла и названию формата
+    (одинаковые файлы одного формата делят одну запись), а index.json
+    запоминает для каждого пути mtime, размер и ключ записи: у
+    неизменённого файла хэш даже не пересчитывается. Общий объём
+    текстов ограничен max_bytes; при превышении удаляются давно не
+    использованные записи (LRU).
+    """
+
+    INDEX_FILE = 'index.json'
+    VERSION = 3
+
+    def __init__(self, cache_dir, max_bytes=1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self.load_index()
+
+    def load_index(self):
+        path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = None
+        # Другая версия кэша могла извлекать текст иначе - начинаем заново
+        if not isinstance(index, dict) or index.get('version') != self.VERSION:
+            index = {'version': self.VERSION, 'files': {}, 'blobs': {}}
+        return index
+
+    def job(self, file_path):
+        """Задание для read_document_cached: ключ известен, если файл не менялся"""
+        entry = self.index['files'].get(os.path.abspath(file_path))
+        known_key = None
+        if entry is not None:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                stat = None
+            if stat is not None and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                known_key = entry['key']
+        return file_path, self.cache_dir, known_key
+
+    def record(self, file_path, key, text, error, cached):
+        """Обновляет индекс по результату read_document_cached (ошибки не кэшируются)"""
+        if key is None or text is None or error is not None:
+            return
+        if cached:
+            self.hits += 1
+        else:
+            self.misses += 1
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return
+        self.index['files'][os.path.abspath(file_path)] = {
+            'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'key': key,
+        }
+        self.index['blobs'][key] = {'bytes': len(text.encode('utf-8')), 'last_used': time.time()}
+
+    def evict(self):
+        """Удаляет давно не использованные тексты, пока объём больше max_bytes"""
+        blobs = self.index['blobs']
+        total = sum(blob['bytes'] for blob in blobs.values())
+        evicted = set()
+        for key in sorted(blobs, key=lambda k: blobs[k]['last_used']):
+            if total <= self.max_bytes:
+                break
+            total -= blobs[key]['bytes']
+            evicted.add(key)
+            try:
+                os.remove(cache_blob_path(self.cache_dir, key))
+            except OSError:
+                pass
+        for key in evicted:
+            del blobs[key]
+        self.index['files'] = {
+            path: entry for path, entry in self.index['files'].items() if entry['key'] in blobs
+        }
+
+    def save(self):
+        """Вытесняет лишнее и атомарно сохраняет индекс"""
+        self.evict()
+        path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+
+
+def matches_any(rel_path, patterns):
+    """Подходит ли путь (относительный, через /) или имя файла под один из шаблонов fnmatch"""
+    name = rel_path.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def scan_dataset(dataset_path, include=None, exclude=None, recursive=True):
+    """Файлы набора данных в детерминированном (отсортированном) порядке
+
+    Возвращает пары (путь, имя документа); имя - путь относительно папки
+    набора через '/'. include/exclude - шаблоны fnmatch для относительного
+    пути или имени файла; без include берутся файлы зарегистрированных
+    форматов и файлы без расширения (их формат определит содержимое).
+    """
+    if os.path.isfile(dataset_path):
+        return [(dataset_path, os.path.basename(dataset_path))]
+    files = []
+    for root, dirnames, filenames in os.walk(dataset_path):
+        dirnames.sort()
+        if not recursive:
+            dirnames.clear()
+        rel_root = os.path.relpath(root, dataset_path).replace(os.sep, '/')
+        for file_name in sorted(filenames):
+            rel_path = file_name if rel_root == '.' else f"{rel_root}/{file_name}"
+            if include is not None:
+                if not matches_any(rel_path, include):
+                    continue
+            else:
+                extension = os.path.splitext(file_name)[1].lower()
+                if extension and extension not in READERS:
+                    continue
+            if exclude and matches_any(rel_path, exclude):
+                continue
+            files.append((os.path.join(root, file_name), rel_path))
+    return files
+
+
+def bounded_map(executor, func, items, max_pending):
+    """Как executor.map, но в работе не больше max_pending задач, а результаты - в порядке items"""
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class ExcelReportWriter:
+    """Потоковая запись отчёта в Excel
+
+    Книги открываются в режиме openpyxl write_only: строки сразу уходят во
+    временный файл, а не копятся в памяти объектами ячеек. Таблица, не
+    влезающая в лист (rows_per_sheet строк с заголовком), продолжается на
+    листах «имя_2», «имя_3»...; если задан sheets_per_file, после стольких
+    листов начинается следующий файл «отчёт_2.xlsx» и т.д.
+    """
+
+    MAX_ROWS = 1048576
+    MAX_COLUMNS = 16384
+
+    def __init__(self, output_path, rows_per_sheet=MAX_ROWS, sheets_per_file=None):
+        self.output_path = output_path
+        self.rows_per_sheet = rows_per_sheet
+        self.sheets_per_file = sheets_per_file
+        self.files = []
+        self.workbook = None
+        self.sheet = None
+        self.sheets_in_file = 0
+        self.rows_in_sheet = 0
+
+    def file_path(self, number):
+        """Путь number-го файла отчёта: первый - output_path, дальше с суффиксом _N"""
+        if number == 1:
+            return self.output_path
+        root, ext = os.path.splitext(self.output_path)
+        return f"{root}_{number}{ext}"
+
+    def new_sheet(self, title):
+        if self.workbook is None or (self.sheets_per_file and self.sheets_in_file >= self.sheets_per_file):
+            self.save_workbook()
+            self.workbook = openpyxl.Workbook(write_only=True)
+            self.files.append(self.file_path(len(self.files) + 1))
+            self.sheets_in_file = 0
+        self.sheet = self.workbook.create_sheet(title)
+        self.sheets_in_file += 1
+        self.rows_in_sheet = 0
+
+    def write_table(self, title, header, rows):
+        """Пишет таблицу по строкам; на каждом листе продолжения повторяется заголовок"""
+        part = 0
+        for row in rows:
+            if part == 0 or self.rows_in_sheet >= self.rows_per_sheet:
+                part += 1
+                self.new_sheet(title if part == 1 else f"{title}_{part}")
+                self.sheet.append(header)
+                self.rows_in_sheet = 1
+            self.sheet.append(row)
+            self.rows_in_sheet += 1
+        if part == 0:
+            # Пустая таблица - лист только с заголовком
+            self.new_sheet(title)
+            self.sheet.append(header)
+            self.rows_in_sheet = 1
+
+    def write_matrix(self, title, vectors, row_labels, column_labels, corner):
+        """Пишет матрицу частот плотными строками
+
+        Столбцы делятся на группы по MAX_COLUMNS - 1 (первый столбец -
+        подписи строк); при нескольких группах к имени листа добавляются
+        номера столбцов группы: «Словоформы_16384-32766».
+        """
+        n_columns = len(column_labels)
+        step = self.MAX_COLUMNS - 1
+        for start in range(0, max(n_columns, 1), step):
+            end = min(start + step, n_columns)
+            sheet_title = title if n_columns <= step else f"{title}_{start + 1}-{end}"
+            header = [corner] + list(column_labels[start:end])
+            rows = ([label] + vectors.dense_row(i, start, end).tolist()
+                    for i, label in enumerate(row_labels))
+            self.write_table(sheet_title, header, rows)
+
+    def save_workbook(self):
+        if self.workbook is not None:
+            self.workbook.save(self.files[-1])
+            self.workbook = None
+
+    def close(self):
+        """Сохраняет последнюю книгу; возвращает список записанных файлов"""
+        self.save_workbook()
+        return self.files
+
+
+class DataProcessor:
+    def __init__(self, cache_dir=None, cache_max_bytes=1 << 30):
         self.vectorizer = DocumentVectorizer()
+        self.read_errors = []
+        # Кэш извлечённого текста для process_dataset (None - без кэша)
+        self.cache = ExtractionCache(cache_dir, cache_max_bytes) if cache_dir else None
     
+    def analyze_text_file(self, file_path, chunk_size=1 << 20, encoding=None):
+        """Анализ большого текстового файла с ограниченным расходом памяти"""
+        return self.vectorizer.analyze(iter_text_chunks(file_path, chunk_size, encoding))
+
+    def analyze_xml_file(self, file_path):
+        """Анализ большого XML-файла: текст уходит в токенизатор по мере разбора"""
+        return self.vectorizer.analyze(join_parts_in_chunks(iter_xml_parts(file_path)))
+
+    def read_file(self, file_path):
+        """Чтение файла любого зарегистрированного формата (READERS)
+
+        Возвращает текст, "" при ошибке чтения или None, если формат не поддерживается.
+        """
+        text, error = read_document(file_path)
+        if error is not None:
+            kind = f"{error.format} " if error.format else ""
+            print(f"Ошибка чтения {kind}файла {file_path}: {error.message}")
+        return text
+
     def read_docx_file(self, file_path):
         """Чтение DOCX файла"""
         try:
-            doc = Document(file_path)
-            text = []
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():  # Игнорируем пустые параграфы
-                    text.append(paragraph.text.strip())
-            return '\n'.join(text)
+            return read_docx_text(file_path)  # Пустые параграфы игнорируются
         except Exception as e:
             print(f"Ошибка чтения DOCX файла {file_path}: {e}")
             return ""
+
+    def read_odt_file(self, file_path):
+        """Чтение ODT файла"""
+        try:
+            return read_odt_text(file_path)
+        except Exception as e:
+            print(f"Ошибка чтения ODT файла {file_path}: {e}")
+            return ""
     
     def read_xml_file(self, file_path):
         """Чтение XML файла с разметкой"""
         try:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-            return self.parse_xml_content(root)
+            return read_xml_text(file_path)
         except Exception as e:
             print(f"Ошибка чтения XML файла {file_path}: {e}")
             return ""
     
     def parse_xml_content(self, root):
         """Парсинг XML контента"""
-        text_parts = []
-        
-        for elem in root.iter():
-            if elem.text and elem.text.strip():
-                text_parts.append(elem.text.strip())
-            if elem.tail and elem.tail.strip():
-                text_parts.append(elem.tail.strip())
-        
-        return ' '.join(text_parts)
+        return parse_xml_text(root)
     
-    def process_dataset(self, dataset_path):
-        """Обработка всего набора данных"""
+    def iter_dataset(self, dataset_path, include=None, exclude=None, recursive=True,
+                     workers=None, use_processes=True, max_pending=None, xml_record_tag=None):
+        """Параллельное чтение набора данных: пары (имя документа, текст) по мере готовности
+
+        Файлы читаются и разбираются в пуле процессов (use_processes=False -
+        потоков) из workers исполнителей; одновременно в работе не больше
+        max_pending файлов, поэтому память ограничена, а документы можно
+        сразу отдавать векторизатору. Порядок - как у scan_dataset, т.е.
+        не зависит от того, какой файл дочитан первым. Пустые и
+        неподдерживаемые файлы пропускаются; ошибки чтения собираются в
+        self.read_errors (список ReadError) вместо печати. Если задан кэш
+        (cache_dir), неизменённые файлы не разбираются повторно.
+        xml_record_tag - каждая запись XML-файлов становится отдельным
+        документом с именем «файл#номер». Такие файлы разбираются не в пуле,
+        а в текущем процессе (iter_xml_records), и записи отдаются по мере
+        разбора, так что в памяти держится одна запись, а не весь файл;
+        остальные файлы тем временем читает пул. Записи, отданные до ошибки
+        разбора, остаются в наборе, а ошибка попадает в self.read_errors.
+        """
+        self.read_errors = []
+        files = scan_dataset(dataset_path, include, exclude, recursive)
+        if self.cache is not None:
+            # Папка кэша может лежать внутри набора данных - её файлы не документы
+            cache_root = os.path.abspath(self.cache.cache_dir)
+            files = [(file_path, name) for file_path, name in files
+                     if os.path.commonpath([cache_root, os.path.abspath(file_path)]) != cache_root]
+        streamed = set()
+        if xml_record_tag is not None:
+            streamed = {file_path for file_path, _ in files if is_xml_file(file_path)}
+        pooled = [file_path for file_path, _ in files if file_path not in streamed]
+        if self.cache is not None:
+            func = read_document_cached
+            items = [self.cache.job(file_path) for file_path in pooled]
+        else:
+            func = read_document
+            items = pooled
+        workers = workers or os.cpu_count() or 1
+        max_pending = max_pending or workers * 4
+
+        try:
+            if workers == 1:
+                results = map(func, items)
+                yield from self.collect_documents(files, results, streamed, xml_record_tag)
+                return
+            executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+            with executor_class(max_workers=workers) as executor:
+                results = bounded_map(executor, func, items, max_pending)
+                yield from self.collect_documents(files, results, streamed, xml_record_tag)
+        finally:
+            if self.cache is not None:
+                self.cache.save()
+
+    def collect_documents(self, files, results, streamed=(), record_tag=None):
+        """Документы в порядке files: результаты пула и записи XML-файлов из streamed"""
+        results = iter(results)
+        for file_path, name in files:
+            if file_path in streamed:
+                yield from self.iter_xml_documents(file_path, name, record_tag)
+                continue
+            result = next(results)
+            if self.cache is not None:
+                text, error, key, cached = result
+                self.cache.record(file_path, key, text, error, cached)
+            else:
+                text, error = result
+            if error is not None:
+                self.read_errors.append(error)
+            if text:
+                yield name, text
+
+    def iter_xml_documents(self, file_path, name, record_tag):
+        """Непустые записи XML-файла как документы «файл#номер» по мере разбора"""
+        number = 0
+        try:
+            for record in iter_xml_records(file_path, record_tag):
+                if record:
+                    number += 1
+                    yield f"{name}#{number}", record
+        except Exception as e:
+            self.read_errors.append(ReadError(file_path, 'XML', type(e).__name__, str(e)))
+
+    def process_dataset(self, dataset_path, include=None, exclude=None, recursive=True,
+                        workers=None, use_processes=True, xml_record_tag=None):
+        """Обработка всего набора данных
+
+        Папка обходится рекурсивно (iter_dataset); формат каждого файла
+        определяет реестр READERS. Ошибки чтения - в self.read_errors.
+        """
         documents = []
         document_names = []
-        
-        if os.path.isfile(dataset_path):
-            # Одиночный файл
-            if dataset_path.endswith('.docx'):
-                text = self.read_docx_file(dataset_path)
-                if text:
-                    documents.append(text)
-                    document_names.append(os.path.basename(dataset_path))
-            elif dataset_path.endswith('.xml'):
-                text = self.read_xml_file(dataset_path)
-                if text:
-                    documents.append(text)
-                    document_names.append(os.path.basename(dataset_path))
-        
-        elif os.path.isdir(dataset_path):
-            # Папка с файлами
-            for file_name in os.listdir(dataset_path):
-                file_path = os.path.join(dataset_path, file_name)
-                if file_name.endswith('.docx'):
-                    text = self.read_docx_file(file_path)
-                    if text:
-                        documents.append(text)
-                        document_names.append(file_name)
-                elif file_name.endswith('.xml'):
-                    text = self.read_xml_file(file_path)
-                    if text:
-                        documents.append(text)
-                        document_names.append(file_name)
+
+        for name, text in self.iter_dataset(dataset_path, include, exclude, recursive,
+                                            workers, use_processes, xml_record_tag=xml_record_tag):
+            documents.append(text)
+            document_names.append(name)
         
         return documents, document_names
     
-    def create_report(self, documents, document_names, output_path):
-        """Создание отчёта в Excel"""
-        # Построение словаря
-        self.vectorizer.build_vocabulary(documents)
-        
-        # Создание векторов
-        word_vectors = self.vectorizer.create_word_vectors(documents, 'word_forms')
-        lemma_vectors = self.vectorizer.create_word_vectors(documents, 'lemma_forms')
-        
-        # Создание Excel файла
-        wb = openpyxl.Workbook()
-        
-        # Лист с словоформами
-        ws_word = wb.active
-        ws_word.title = "Словоформы"
-        
-        # Заголовки
-        headers = ['Документ'] + [self.vectorizer.index_to_word[i] for i in range(len(self.vectorizer.vocabulary))]
-        ws_word.append(headers)
-        
-        # Данные
-        for i, (doc_name, vector) in enumerate(zip(document_names, word_vectors)):
-            row = [doc_name] + vector
-            ws_word.append(row)
-        
-        # Лист с начальными формами
-        ws_lemma = wb.create_sheet("Начальные_формы")
-        ws_lemma.append(headers)
-        
-        for i, (doc_name, vector) in enumerate(zip(document_names, lemma_vectors)):
-            row = [doc_name] + vector
-            ws_lemma.append(row)
+    def save_vectors(self, directory, word_vectors, lemma_vectors, document_names):
+        """Сохраняет векторизатор и векторы документов в папку
+
+        Структура: vectorizer.json, documents.json (имена документов) и
+        папки word_forms/ и lemma_forms/ с массивами CSR в формате .npy.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.vectorizer.save(os.path.join(directory, 'vectorizer.json'))
+        with open(os.path.join(directory, 'documents.json'), 'w', encoding='utf-8') as f:
+            json.dump(list(document_names), f, ensure_ascii=False)
+        word_vectors.save(os.path.join(directory, 'word_forms'))
+        lemma_vectors.save(os.path.join(directory, 'lemma_forms'))
+
+    def load_vectors(self, directory, mmap=True):
+        """Загружает сохранённые save_vectors данные
+
+        Векторизатор становится текущим; возвращает
+        (векторы словоформ, векторы лемм, имена документов).
+        """
+        self.vectorizer = DocumentVectorizer.load(os.path.join(directory, 'vectorizer.json'))
+        with open(os.path.join(directory, 'documents.json'), 'r', encoding='utf-8') as f:
+            document_names = json.load(f)
+        word_vectors = SparseVectors.load(os.path.join(directory, 'word_forms'), mmap)
+        lemma_vectors = SparseVectors.load(os.path.join(directory, 'lemma_forms'), mmap)
+        return word_vectors, lemma_vectors, document_names
+
+    REPORT_LAYOUTS = ('wide', 'long', 'transposed')
+
+    def create_report(self, documents, document_names, output_path, workers=None, layout='wide',
+                      rows_per_sheet=ExcelReportWriter.MAX_ROWS, sheets_per_file=None):
+        """Создание отчёта в Excel
+
+        workers > 1 - векторизация корпуса на нескольких процессах
+        (fit_transform); статистика тогда считается по векторам.
+
+        layout - вид листов с векторами:
+        'wide' - строка на документ, столбец на слово (как раньше; при
+        словаре больше 16383 слов столбцы делятся на несколько листов);
+        'long' - только ненулевые частоты строками (Документ, Слово, Частота);
+        'transposed' - строка на слово, столбец на документ.
+        Отчёт пишется потоково (ExcelReportWriter), память не растёт с корпусом.
+        """
+        if layout not in self.REPORT_LAYOUTS:
+            raise ValueError(f"Неизвестный вид отчёта: {layout}")
+
+        if workers is not None and workers > 1 and self.vectorizer.mode == 'vocabulary':
+            word_vectors, lemma_vectors, word_order = self.vectorizer.fit_transform(documents, workers)
+            doc_lengths = word_vectors.row_sums().tolist()
+            lemma_lengths = lemma_vectors.row_sums().tolist()
+            frequencies = word_vectors.column_sums()
+            word_freq = Counter({
+                word: int(frequencies[self.vectorizer.word_to_index[word]]) for word in word_order
+            })
+        else:
+            # Каждый документ токенизируется и лемматизируется один раз
+            analyses = self.vectorizer.analyze_documents(documents)
+
+            # Построение словаря
+            self.vectorizer.build_vocabulary(analyses)
+
+            # Создание векторов
+            word_vectors = self.vectorizer.create_word_vectors(analyses, 'word_forms')
+            lemma_vectors = self.vectorizer.create_word_vectors(analyses, 'lemma_forms')
+
+            doc_lengths = [analysis.word_total for analysis in analyses]
+            lemma_lengths = [analysis.lemma_total for analysis in analyses]
+            word_freq = Counter()
+            for analysis in analyses:
+                word_freq.update(analysis.word_counts)
         
+        writer = ExcelReportWriter(output_path, rows_per_sheet, sheets_per_file)
+        words = [self.vectorizer.feature_name(i) for i in range(self.vectorizer.n_features)]
+
+        # Листы со словоформами и начальными формами
+        for title, vectors in (("Словоформы", word_vectors), ("Начальные_формы", lemma_vectors)):
+            if layout == 'wide':
+                writer.write_matrix(title, vectors, document_names, words, 'Документ')
+            elif layout == 'transposed':
+                writer.write_matrix(title, vectors.transpose(), words, document_names, 'Слово')
+            else:
+                rows = (
+                    [doc_name, words[idx], count]
+                    for i, doc_name in enumerate(document_names)
+                    for idx, count in zip(*(part.tolist() for part in vectors.row(i)))
+                )
+                writer.write_table(title, ['Документ', 'Слово', 'Частота'], rows)
+
         # Лист со статистикой
-        ws_stats = wb.create_sheet("Статистика")
-        ws_stats.append(['Параметр', 'Значение'])
-        ws_stats.append(['Всего документов', len(documents)])
-        ws_stats.append(['Размер словаря', len(self.vectorizer.vocabulary)])
+        stats = []
+        stats.append(['Всего документов', len(documents)])
+        stats.append(['Размер словаря', self.vectorizer.n_features])
         
         # Подсчет общего количества слов
-        total_word_forms = sum(len(self.vectorizer.extract_word_forms(doc)) for doc in documents)
-        total_lemmas = sum(len(self.vectorizer.extract_lemma_forms(doc)) for doc in documents)
+        total_word_forms = sum(doc_lengths)
+        total_lemmas = sum(lemma_lengths)
         
-        ws_stats.append(['Общее количество слов (словоформы)', total_word_forms])
-        ws_stats.append(['Общее количество слов (леммы)', total_lemmas])
+        stats.append(['Общее количество слов (словоформы)', total_word_forms])
+        stats.append(['Общее количество слов (леммы)', total_lemmas])
         
         # Статистика по самому частому документу
         if documents:
-            doc_lengths = [len(self.vectorizer.extract_word_forms(doc)) for doc in documents]
-            ws_stats.append(['Максимум слов в документе', max(doc_lengths)])
-            ws_stats.append(['Минимум слов в документе', min(doc_lengths)])
-            ws_stats.append(['Среднее количество слов', sum(doc_lengths) // len(doc_lengths)])
+            stats.append(['Максимум слов в документе', max(doc_lengths)])
+            stats.append(['Минимум слов в документе', min(doc_lengths)])
+            stats.append(['Среднее количество слов', sum(doc_lengths) // len(doc_lengths)])
         
         # Топ-10 самых частых слов
-        all_words = []
-        for doc in documents:
-            all_words.extend(self.vectorizer.extract_word_forms(doc))
-        
-        word_freq = Counter(all_words)
         top_words = word_freq.most_common(10)
         
-        ws_stats.append([])
-        ws_stats.append(['Топ-10 самых частых слов:', 'Частота'])
+        stats.append([])
+        stats.append(['Топ-10 самых частых слов:', 'Частота'])
         for word, freq in top_words:
-            ws_stats.append([word, freq])
+            stats.append([word, freq])
+        writer.write_table("Статистика", ['Параметр', 'Значение'], stats)
         
         # Сохранение
-        wb.save(output_path)
+        writer.close()
         
         return word_vectors, lemma_vectors
 
@@ -311,8 +1750,13 @@ def main():
             word_vectors, lemma_vectors = processor.create_report(documents, document_names, output_file)
             
             print(f"Отчёт сохранён в файл: {output_file}")
+
+            vectors_dir = "векторы_документов"
+            processor.save_vectors(vectors_dir, word_vectors, lemma_vectors, document_names)
+            print(f"Векторы сохранены в папку: {vectors_dir}")
             print(f"Размер словаря: {len(processor.vectorizer.vocabulary)} слов")
-            print(f"Размер вектора документа: {len(word_vectors[0])} измерений")
+            print(f"Размер вектора документа: {word_vectors.shape[1]} измерений")
+            print(f"Ненулевых элементов: {len(word_vectors.data)} из {word_vectors.shape[0] * word_vectors.shape[1]}")
             
             # Показать некоторые статистики
             print(f"\n=== СТАТИСТИКА ===")
@@ -328,7 +1772,7 @@ def main():
         print(f"Файл {docx_file} не найден в текущей директории")
         print("Доступные файлы в текущей директории:")
         for file in os.listdir('.'):
-            if file.endswith('.docx') or file.endswith('.xml'):
+            if os.path.splitext(file)[1].lower() in READERS:
                 print(f"  - {file}")
 
 def create_technical_report():
@@ -1,109 +1,850 @@
 import os
 import pandas as pd
 from tqdm import tqdm
-from openpyxl import load_workbook
-from bs4 import BeautifulSoup
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+from lxml import etree
 import requests
 import shutil
+import time
+import json
+import hashlib
+import importlib.util
+import re
+import zipfile
+from xml.sax.saxutils import escape as xml_escape
 
+import race_metrics as metrics
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def download_races():
-    """Скачивает файлы гонок с названиями"""
-    HTML_FILE = "RaceMann.html"
-    BASE_URL = "https://miks.racemann.com"
-    DOWNLOAD_DIR = "miks_driverstats"
-    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-    with open(HTML_FILE, "r", encoding="utf-8") as f:
-        soup = BeautifulSoup(f, "lxml")
+BASE_URL = "https://miks.racemann.com"
+HTML_FILE = "RaceMann.html"
+DOWNLOAD_DIR = "miks_driverstats"
+MANIFEST_FILE = "manifest.json"
+CACHE_DIR = "miks_driverstats_cache"
+CACHE_INDEX_FILE = "index.json"
+RACE_INDEX_FILE = "race_index.json"
+METRICS_FILE = "race_pipeline.prom"
+
+
+def make_session(workers=8, retries=3, backoff=0.5):
+    """Создаёт HTTP-сессию с пулом keep-alive соединений и повторами"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def download_race(session, race_id, title, base_url=BASE_URL, download_dir=DOWNLOAD_DIR,
+                  timeout=30, known=None):
+    """Скачивает файл одной гонки и возвращает сводку по результату
+
+    known - запись манифеста для этой гонки: если в ней есть ETag/Last-Modified,
+    запрос делается условным и при ответе 304 файл не перезаписывается.
+    """
+    download_url = f"{base_url}/DriverStat/driverslistcsv/{race_id}?allGroups=false&allStages=false"
+    filename = os.path.join(download_dir, f"{title}_{race_id}.xlsx")
+    result = {"race_id": race_id, "title": title, "file": filename,
+              "status": "ok", "bytes": 0, "seconds": 0.0, "error": None, "error_type": None,
+              "size": None, "sha256": None, "etag": None, "last_modified": None}
+    headers = {}
+    if known:
+        if known.get("etag"):
+            headers["If-None-Match"] = known["etag"]
+        if known.get("last_modified"):
+            headers["If-Modified-Since"] = known["last_modified"]
+    started = time.perf_counter()
+    try:
+        response = session.get(download_url, headers=headers, timeout=timeout)
+        if response.status_code == 304:
+            result.update({k: known.get(k) for k in ("size", "sha256", "etag", "last_modified")})
+            result["status"] = "not_modified"
+            result["seconds"] = time.perf_counter() - started
+            return result
+        response.raise_for_status()
+
+        # Файл пишется один раз как есть: название гонки хранится в имени
+        # файла и манифесте и добавляется в таблицу при объединении
+        content = response.content
+        with open(filename, "wb") as f:
+            f.write(content)
+        result["bytes"] = len(content)
+        result["size"] = len(content)
+        result["sha256"] = hashlib.sha256(content).hexdigest()
+        result["etag"] = response.headers.get("ETag")
+        result["last_modified"] = response.headers.get("Last-Modified")
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["error_type"] = type(e).__name__
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+class RaceListTarget:
+    """SAX-цель для lxml: собирает только элементы li[data-race-id] и их .race-list-name"""
+
+    def __init__(self):
+        self.races = []
+        self._race_id = None
+        self._depth = 0
+        self._name_depth = None
+        self._name_parts = None
+
+    def start(self, tag, attrib):
+        if self._race_id is None:
+            if tag == "li" and "data-race-id" in attrib:
+                self._race_id = attrib["data-race-id"]
+                self._depth = 1
+                self._name_parts = None
+            return
+        self._depth += 1
+        if (self._name_parts is None and self._name_depth is None
+                and "race-list-name" in attrib.get("class", "").split()):
+            self._name_depth = self._depth
+            self._name_parts = []
+
+    def end(self, tag):
+        if self._race_id is None:
+            return
+        if self._name_depth == self._depth:
+            self._name_depth = None
+        self._depth -= 1
+        if self._depth == 0:
+            name = "".join(self._name_parts) if self._name_parts is not None else None
+            self.races.append((self._race_id, name))
+            self._race_id = None
+
+    def data(self, data):
+        if self._name_depth is not None:
+            self._name_parts.append(data)
+
+    def close(self):
+        return self.races
 
-    race_items = soup.select("li[data-race-id]")
-    miks_races = []
 
-    for item in race_items:
-        race_name = item.select_one(".race-list-name")
-        if race_name and any(keyword in race_name.text.upper() for keyword in ["MIKS", "SHONX"]) and "КВАЛИФИКАЦИЯ" not in race_name.text.upper():
-            race_id = item["data-race-id"]
-            title = race_name.text.strip().replace(" ", "_").replace("/", "-")
+def parse_race_list(html_file):
+    """Потоково разбирает страницу и возвращает все (race_id, название) без построения дерева"""
+    parser = etree.HTMLParser(target=RaceListTarget(), encoding="utf-8")
+    with open(html_file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            parser.feed(block)
+    return parser.close()
+
+
+def find_races(html_file=HTML_FILE, keywords=("MIKS", "SHONX"), exclude=("КВАЛИФИКАЦИЯ",),
+               cache_dir=CACHE_DIR):
+    """Возвращает список (race_id, title) гонок MIKS/SHONX из страницы RaceMann
+
+    В название должно входить одно из keywords и ни одного из exclude (без
+    учёта регистра). Результат кэшируется в cache_dir по SHA-256 страницы
+    и набору фильтров, поэтому неизменившаяся страница повторно не разбирается.
+    """
+    started = time.perf_counter()
+    keywords = [keyword.upper() for keyword in keywords]
+    exclude = [word.upper() for word in exclude]
+    with open(html_file, "rb") as f:
+        html_hash = hashlib.sha256(f.read()).hexdigest()
+    cache_key = {"sha256": html_hash, "keywords": keywords, "exclude": exclude}
+
+    cache_path = os.path.join(cache_dir, RACE_INDEX_FILE) if cache_dir else None
+    cached = read_json(cache_path, {}) if cache_path else {}
+    if isinstance(cached, dict) and cached.get("key") == cache_key and "races" in cached:
+        metrics.CACHE_REQUESTS.inc(cache="race_index", result="hit")
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="race_index")
+        return [tuple(race) for race in cached["races"]]
+
+    miks_races = []
+    for race_id, name in parse_race_list(html_file):
+        if name is None:
+            continue
+        upper_name = name.upper()
+        if any(keyword in upper_name for keyword in keywords) and not any(word in upper_name for word in exclude):
+            title = name.strip().replace(" ", "_").replace("/", "-")
             miks_races.append((race_id, title))
 
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        write_json_atomic(cache_path, {"key": cache_key, "races": miks_races})
+        metrics.CACHE_REQUESTS.inc(cache="race_index", result="miss")
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="race_index")
+    return miks_races
+
+
+def fetch_races(races, base_url=BASE_URL, download_dir=DOWNLOAD_DIR,
+                workers=8, retries=3, backoff=0.5, timeout=30, manifest=None):
+    """Параллельно скачивает список гонок через общий пул соединений"""
+    manifest = manifest or {}
+    results = []
+    started = time.perf_counter()
+    with make_session(workers, retries, backoff) as session, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(download_race, session, race_id, title, base_url, download_dir,
+                            timeout, manifest.get(race_id))
+            for race_id, title in races
+        ]
+        # Результаты собираем в порядке списка гонок, чтобы сводка была детерминированной
+        for future in futures:
+            result = future.result()
+            results.append(result)
+            record_download(result)
+            if result["status"] == "ok":
+                print(f"[✓] Скачан: {result['file']}")
+            elif result["status"] == "error":
+                print(f"[!] Ошибка при скачивании для {result['race_id']}: {result['error']}")
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="download")
+    return results
+
+
+def record_download(result):
+    """Заносит результат скачивания одной гонки в метрики"""
+    metrics.DOWNLOADS.inc(status=result["status"])
+    metrics.DOWNLOAD_SECONDS.observe(result["seconds"], status=result["status"])
+    metrics.LAST_DOWNLOAD_SECONDS.set(result["seconds"], race=f"{result['title']}_{result['race_id']}")
+    metrics.DOWNLOADED_BYTES.inc(result["bytes"])
+    if result["error_type"]:
+        metrics.ERRORS.inc(stage="download", type=result["error_type"])
+
+
+def download_races(html_file=HTML_FILE, base_url=BASE_URL, download_dir=DOWNLOAD_DIR,
+                   workers=8, retries=3, backoff=0.5, timeout=30, cache_dir=CACHE_DIR):
+    """Скачивает файлы гонок с названиями (cache_dir - кэш списка гонок для find_races)"""
+    os.makedirs(download_dir, exist_ok=True)
+
+    miks_races = find_races(html_file, cache_dir=cache_dir)
     print(f"[+] Найдено MIKS/SHONX гонок: {len(miks_races)}")
 
-    for race_id, title in miks_races:
-        download_url = f"{BASE_URL}/DriverStat/driverslistcsv/{race_id}?allGroups=false&allStages=false"
-        try:
-            response = requests.get(download_url)
-            response.raise_for_status()
-
-            filename = os.path.join(DOWNLOAD_DIR, f"{title}_{race_id}.xlsx")
-            with open(filename, "wb") as f:
-                f.write(response.content)
-
-            # Добавляем название гонки в скачанный файл
-            add_title_to_excel(filename, title)
-            
-            print(f"[✓] Скачан и обработан: {filename}")
-        except Exception as e:
-            print(f"[!] Ошибка при скачивании для {race_id}: {e}")
-
-def add_title_to_excel(filepath, title):
-    """Добавляет столбец с названием гонки в файл"""
+    started = time.perf_counter()
+    results = fetch_races(miks_races, base_url, download_dir, workers, retries, backoff, timeout)
+    print_download_summary(results, time.perf_counter() - started)
+
+    manifest = {}
+    update_manifest(manifest, results)
+    save_manifest(download_dir, manifest)
+    return results
+
+
+def file_fingerprint(path):
+    """Возвращает размер и SHA-256 файла"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return os.path.getsize(path), digest.hexdigest()
+
+
+def read_json(path, default, warning=None):
+    """Читает JSON-файл; если файла нет или он повреждён, возвращает default
+
+    warning - начало предупреждения о повреждённом файле (без него порча молчаливая).
+    """
+    if not os.path.exists(path):
+        return default
     try:
-        df = pd.read_excel(filepath, sheet_name='Список участников')
-        df['Название_гонки'] = title  # Добавляем новый столбец
-        
-        # Сохраняем обратно в тот же файл
-        with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Список участников', index=False)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        if warning:
+            print(f"[!] {warning} {path} повреждён, он будет пересобран: {e}")
+        return default
+
+
+def write_json_atomic(path, data):
+    """Записывает JSON через временный файл, чтобы прерванная запись не портила старый"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(download_dir=DOWNLOAD_DIR):
+    """Читает манифест race_id -> файл, размер, хэш, ETag/Last-Modified"""
+    return read_json(os.path.join(download_dir, MANIFEST_FILE), {}, warning="Манифест")
+
+
+def save_manifest(download_dir, manifest):
+    """Атомарно сохраняет манифест рядом со скачанными файлами"""
+    write_json_atomic(os.path.join(download_dir, MANIFEST_FILE), manifest)
+
+
+def update_manifest(manifest, results):
+    """Заносит в манифест успешно скачанные и неизменившиеся гонки"""
+    for r in results:
+        if r["status"] in ("ok", "not_modified"):
+            manifest[r["race_id"]] = {
+                "title": r["title"],
+                "file": os.path.basename(r["file"]),
+                "size": r["size"],
+                "sha256": r["sha256"],
+                "etag": r["etag"],
+                "last_modified": r["last_modified"],
+            }
+
+
+def is_race_file_valid(download_dir, entry, verify=False):
+    """Проверяет, что файл из манифеста на месте и не изменился"""
+    path = os.path.join(download_dir, entry["file"])
+    if not os.path.exists(path) or os.path.getsize(path) != entry.get("size"):
+        return False
+    if verify:
+        return file_fingerprint(path)[1] == entry.get("sha256")
+    return True
+
+
+def sync_races(html_file=HTML_FILE, base_url=BASE_URL, download_dir=DOWNLOAD_DIR,
+               workers=8, retries=3, backoff=0.5, timeout=30, revalidate=False, verify=False,
+               cache_dir=CACHE_DIR):
+    """Инкрементально синхронизирует папку гонок с RaceMann.html
+
+    Скачиваются только новые гонки и гонки, файл которых пропал или
+    изменился; гонки, исчезнувшие со страницы, удаляются. revalidate=True
+    дополнительно перепроверяет известные гонки условными запросами,
+    verify=True сверяет SHA-256 локальных файлов, а не только размер.
+    cache_dir - кэш списка гонок для find_races (None - без кэша).
+    """
+    os.makedirs(download_dir, exist_ok=True)
+    started = time.perf_counter()
+
+    races = find_races(html_file, cache_dir=cache_dir)
+    manifest = load_manifest(download_dir)
+    print(f"[+] Найдено MIKS/SHONX гонок: {len(races)}, в манифесте: {len(manifest)}")
+
+    # Файлы, скачанные до появления манифеста, принимаем как есть
+    for race_id, title in races:
+        filename = f"{title}_{race_id}.xlsx"
+        path = os.path.join(download_dir, filename)
+        if race_id not in manifest and os.path.exists(path):
+            size, sha256 = file_fingerprint(path)
+            manifest[race_id] = {"title": title, "file": filename, "size": size,
+                                 "sha256": sha256, "etag": None, "last_modified": None}
+
+    to_fetch = []
+    for race_id, title in races:
+        entry = manifest.get(race_id)
+        if (entry is None or entry["title"] != title or revalidate
+                or not is_race_file_valid(download_dir, entry, verify)):
+            to_fetch.append((race_id, title))
+
+    metrics.CACHE_REQUESTS.inc(len(races) - len(to_fetch), cache="manifest", result="hit")
+    metrics.CACHE_REQUESTS.inc(len(to_fetch), cache="manifest", result="miss")
+
+    current_ids = {race_id for race_id, _ in races}
+    pruned = 0
+    for race_id in sorted(set(manifest) - current_ids):
+        path = os.path.join(download_dir, manifest.pop(race_id)["file"])
+        if os.path.exists(path):
+            os.remove(path)
+        pruned += 1
+        print(f"[-] Удалена исчезнувшая гонка: {path}")
+
+    # Заголовки для условного запроса имеют смысл, только если файл цел и не переименован
+    known = {race_id: manifest[race_id] for race_id, title in to_fetch
+             if race_id in manifest and manifest[race_id]["title"] == title
+             and is_race_file_valid(download_dir, manifest[race_id])}
+    results = fetch_races(to_fetch, base_url, download_dir, workers, retries, backoff,
+                          timeout, known)
+    for r in results:
+        entry = manifest.get(r["race_id"])
+        if r["status"] == "ok" and entry and entry["file"] != os.path.basename(r["file"]):
+            # Гонку переименовали: старый файл больше не нужен
+            old_path = os.path.join(download_dir, entry["file"])
+            if os.path.exists(old_path):
+                os.remove(old_path)
+    update_manifest(manifest, results)
+    save_manifest(download_dir, manifest)
+
+    downloaded = sum(r["status"] == "ok" for r in results)
+    failed = sum(r["status"] == "error" for r in results)
+    print(f"[+] Синхронизация: новых/изменённых {downloaded}, без изменений "
+          f"{len(races) - downloaded - failed}, удалено {pruned}, ошибок {failed} "
+          f"за {time.perf_counter() - started:.1f} с")
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="sync")
+    return results
+
+
+def print_download_summary(results, elapsed):
+    """Печатает итог скачивания по всем гонкам"""
+    ok = [r for r in results if r["status"] == "ok"]
+    total_bytes = sum(r["bytes"] for r in ok)
+    print(f"[+] Скачано: {len(ok)}, ошибок: {len(results) - len(ok)}, "
+          f"{total_bytes / 1024:.1f} КБ за {elapsed:.1f} с")
+
+def race_title_from_filename(filename):
+    """Восстанавливает название гонки из имени файла вида <название>_<race_id>.xlsx"""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return stem.rsplit("_", 1)[0]
+
+
+def read_race_file(file_path, title=None):
+    """Читает таблицу участников гонки и добавляет столбец с её названием"""
+    df = pd.read_excel(file_path, sheet_name='Список участников')
+    # В файлах, скачанных старой версией скрипта, столбец уже есть
+    if 'Название_гонки' not in df.columns:
+        df['Название_гонки'] = title or race_title_from_filename(file_path)
+    return df
+
+def load_race_file(file_path, title=None, cache_dir=None, cached=None):
+    """Читает файл гонки в рабочем процессе; ошибки возвращаются, а не бросаются
+
+    С cache_dir таблица берётся из колоночного кэша (Feather), если исходный
+    файл не менялся: совпали размер и mtime, а при другом mtime - SHA-256.
+    Возвращает (таблица, ошибка, новая запись индекса кэша, сведения для
+    метрик: длительность, источник "xlsx"/"cache" и тип ошибки).
+    """
+    started = time.perf_counter()
+    info = {"seconds": 0.0, "source": "xlsx", "error_type": None}
+    try:
+        df, entry = read_race_file_cached(file_path, title, cache_dir, cached, info)
+        error = None
     except Exception as e:
-        print(f"Ошибка при добавлении названия в {filepath}: {e}")
+        df, entry, error = None, None, str(e)
+        info["error_type"] = type(e).__name__
+    info["seconds"] = time.perf_counter() - started
+    return df, error, entry, info
+
+
+def read_race_file_cached(file_path, title, cache_dir, cached, info):
+    """Читает файл гонки из кэша или из xlsx, обновляя кэш"""
+    if cache_dir is None:
+        return read_race_file(file_path, title), None
+
+    stat = os.stat(file_path)
+    cache_name = os.path.splitext(os.path.basename(file_path))[0] + ".feather"
+    cache_path = os.path.join(cache_dir, cache_name)
+    sha256 = None
+    if cached and cached["size"] == stat.st_size and os.path.exists(cache_path):
+        if cached["mtime_ns"] != stat.st_mtime_ns:
+            sha256 = file_fingerprint(file_path)[1]
+        if sha256 is None or sha256 == cached["sha256"]:
+            info["source"] = "cache"
+            return pd.read_feather(cache_path), dict(cached, mtime_ns=stat.st_mtime_ns)
+
+    df = read_race_file(file_path, title)
+    df.to_feather(cache_path)
+    entry = {
+        "cache": cache_name,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha256 or file_fingerprint(file_path)[1],
+    }
+    return df, entry
+
+
+def load_cache_index(cache_dir):
+    """Читает индекс колоночного кэша: имя xlsx -> файл кэша, размер, mtime, хэш"""
+    return read_json(os.path.join(cache_dir, CACHE_INDEX_FILE), {})
+
+
+def save_cache_index(cache_dir, index):
+    """Атомарно сохраняет индекс колоночного кэша"""
+    write_json_atomic(os.path.join(cache_dir, CACHE_INDEX_FILE), index)
+
+
+def excel_rows(df):
+    """Построчно отдаёт значения таблицы для записи в Excel (NaN -> пустая ячейка)"""
+    columns = [[None if pd.isna(value) else value for value in df[column].tolist()]
+               for column in df.columns]
+    return zip(*columns)
+
+
+def write_xlsx_streaming(merged_data, output_file):
+    """Пишет таблицу через write-only книгу openpyxl, не держа все ячейки в памяти"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Список участников')
+    header = []
+    for column in merged_data.columns:
+        cell = WriteOnlyCell(ws, value=column)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    ws.append(header)
+    for row in excel_rows(merged_data):
+        ws.append(row)
+    wb.save(output_file)
+
+
+def xlsx_cell_xml(ref, value):
+    """XML одной ячейки листа: числа как есть, строки - inline-строкой"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}" t="n"><v>{value!r}</v></c>'
+    return f'<c r="{ref}" t="inlineStr"><is><t>{xml_escape(str(value))}</t></is></c>'
+
+
+def last_row_number(data, default):
+    """Номер последней целиком попавшей в кусок XML листа строки <row r="N"> или default"""
+    pos = data.rfind(b'<row r="')
+    while pos >= 0:
+        match = re.match(rb'<row r="(\d+)"', data[pos:pos + 32])
+        if match:
+            return int(match.group(1))
+        pos = data.rfind(b'<row r="', 0, pos)
+    return default
+
+
+def append_xlsx_rows(output_file, new_data, block_size=1 << 20):
+    """Дописывает строки в конец листа, не разбирая книгу
+
+    xlsx - это zip, поэтому XML листа копируется блоками по block_size
+    через src.open()/dst.open() до </sheetData>, новые строки вставляются
+    перед ним, а остальные части архива переносятся без изменений. Память
+    не зависит от размера книги, но время - O(размер книги): часть архива
+    с листом нельзя дописать, её приходится распаковать и сжать заново
+    целиком. Элемент <dimension> (необязательный) удаляется, чтобы не
+    оставлять устаревший диапазон.
+    """
+    sheet_name = "xl/worksheets/sheet1.xml"
+    marker = b"</sheetData>"
+    letters = [get_column_letter(i + 1) for i in range(len(new_data.columns))]
+    tmp_file = output_file + ".tmp"
+    with zipfile.ZipFile(output_file) as src, zipfile.ZipFile(tmp_file, "w", zipfile.ZIP_DEFLATED) as dst:
+        if sheet_name not in src.namelist():
+            raise ValueError(f"в {output_file} не найден лист с данными")
+        for item in src.infolist():
+            with src.open(item) as fin, dst.open(item, "w", force_zip64=item.file_size > 1 << 30) as fout:
+                if item.filename != sheet_name:
+                    shutil.copyfileobj(fin, fout, block_size)
+                    continue
+                last_row = 1
+                carry = b""
+                first_block = True
+                while True:
+                    block = fin.read(block_size)
+                    data = carry + block
+                    if first_block:
+                        data = re.sub(rb"<dimension [^>]*/>", b"", data, count=1)
+                        first_block = False
+                    end = data.find(marker)
+                    if end >= 0:
+                        break
+                    if not block:
+                        raise ValueError(f"в {output_file} не найден лист с данными")
+                    last_row = last_row_number(data, last_row)
+                    # Разрезанные границей блока тег <row> или </sheetData> дочитываются со следующим блоком
+                    cut = max(0, len(data) - 32)
+                    fout.write(data[:cut])
+                    carry = data[cut:]
+                last_row = last_row_number(data[:end], last_row)
+                fout.write(data[:end])
+                for offset, row in enumerate(excel_rows(new_data), 1):
+                    r = last_row + offset
+                    cells = "".join(xlsx_cell_xml(f"{letter}{r}", value) for letter, value in zip(letters, row))
+                    fout.write(f'<row r="{r}">{cells}</row>'.encode("utf-8"))
+                fout.write(data[end:])
+                shutil.copyfileobj(fin, fout, block_size)
+    os.replace(tmp_file, output_file)
+
+
+def append_json_records(output_file, new_data):
+    """Дописывает записи в конец JSON-массива на месте, не перезаписывая файл"""
+    records = json.dumps(new_data.to_dict("records"), ensure_ascii=False, indent=1)
+    body = records[1:-1].strip("\n")
+    with open(output_file, "r+b") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        # Ищем закрывающую скобку массива с конца файла
+        while pos > 0:
+            step = min(4096, pos)
+            f.seek(pos - step)
+            block = f.read(step)
+            idx = block.rfind(b"]")
+            if idx >= 0:
+                pos = pos - step + idx
+                break
+            pos -= step
+        else:
+            raise ValueError(f"{output_file} не похож на JSON-массив")
+        f.seek(max(0, pos - 64))
+        before = f.read(pos - max(0, pos - 64)).rstrip()
+        separator = "\n" if before.endswith(b"[") else ",\n"
+        f.seek(pos)
+        f.truncate()
+        f.write((separator + body + "\n]").encode("utf-8"))
+
+
+def save_merged(merged_data, output_file):
+    """Сохраняет объединённую таблицу в формате по расширению файла
+
+    .xlsx и .json - как раньше, .feather и .parquet - колоночные файлы,
+    которые загружаются за миллисекунды.
+    """
+    ext = os.path.splitext(output_file)[1].lower()
+    if ext == ".feather":
+        merged_data.to_feather(output_file)
+    elif ext == ".parquet":
+        merged_data.to_parquet(output_file, index=False)
+    elif ext == ".json":
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(merged_data.to_dict("records"), f, ensure_ascii=False, indent=1)
+    else:
+        write_xlsx_streaming(merged_data, output_file)
+
+
+def append_merged(new_data, output_file):
+    """Дописывает строки новых гонок в уже существующий итоговый файл
+
+    В .xlsx и .json дописываются только новые строки. .feather и .parquet
+    дописывать на месте нельзя: файл читается и перезаписывается целиком,
+    так что время растёт с общим числом строк, а не с числом новых.
+    """
+    ext = os.path.splitext(output_file)[1].lower()
+    if ext == ".feather":
+        pd.concat([pd.read_feather(output_file), new_data], ignore_index=True).to_feather(output_file)
+    elif ext == ".parquet":
+        merged_data = pd.concat([pd.read_parquet(output_file), new_data], ignore_index=True)
+        merged_data.to_parquet(output_file, index=False)
+    elif ext == ".json":
+        append_json_records(output_file, new_data)
+    else:
+        append_xlsx_rows(output_file, new_data)
+
 
-def merge_xlsx_files(input_folder, output_file):
-    """Объединяет файлы с добавленными названиями гонок"""
-    xlsx_files = [
+def output_state_path(output_files):
+    """Файл состояния итоговых файлов: какие гонки в них уже записаны"""
+    return os.path.splitext(output_files[0])[0] + ".state.json"
+
+
+def load_output_state(output_files):
+    """Возвращает (гонки в итоговых файлах: файл -> размер/mtime, столбцы итоговых файлов)
+
+    None, если итоговые файлы менялись извне или состояние старого формата.
+    """
+    state = read_json(output_state_path(output_files), None)
+    if not isinstance(state, dict):
+        return None
+    if state.get("outputs") != {p: stat_fingerprint(p) for p in output_files}:
+        return None
+    if not isinstance(state.get("races"), dict) or not isinstance(state.get("columns"), list):
+        # Старый формат без отпечатков файлов гонок или без заголовка
+        return None
+    return state["races"], state["columns"]
+
+
+def save_output_state(output_files, races, columns):
+    """Запоминает записанные гонки (файл -> размер/mtime), заголовок и размер/mtime каждого итогового файла"""
+    state = {"races": races, "columns": list(columns),
+             "outputs": {p: stat_fingerprint(p) for p in output_files}}
+    write_json_atomic(output_state_path(output_files), state)
+
+
+def race_fingerprints(input_folder, files):
+    """Размер и mtime файлов гонок: перекачанная гонка получает новый отпечаток"""
+    return {file: stat_fingerprint(os.path.join(input_folder, file)) for file in files}
+
+
+def stat_fingerprint(path):
+    """Размер и mtime файла; None, если его нет"""
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def read_race_files(input_folder, xlsx_files, workers=None, cache_dir=None, prune=False):
+    """Читает файлы гонок (параллельно и через кэш) и возвращает таблицы и имена прочитанных"""
+    if cache_dir is not None and importlib.util.find_spec("pyarrow") is None:
+        print("[!] pyarrow не установлен, колоночный кэш отключён")
+        cache_dir = None
+    cache_index = {}
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        cache_index = load_cache_index(cache_dir)
+
+    # Название гонки берём из манифеста, а для файлов без записи - из имени файла
+    titles = {entry["file"]: entry["title"] for entry in load_manifest(input_folder).values()}
+    file_paths = [os.path.join(input_folder, file) for file in xlsx_files]
+    file_titles = [titles.get(file) for file in xlsx_files]
+    cached = [cache_index.get(file) for file in xlsx_files]
+    cache_dirs = [cache_dir] * len(xlsx_files)
+
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        loaded = map(load_race_file, file_paths, file_titles, cache_dirs, cached)
+        frames, read_files, new_index = collect_race_frames(xlsx_files, loaded)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(file_paths) // (workers * 4))
+            loaded = executor.map(load_race_file, file_paths, file_titles, cache_dirs, cached,
+                                  chunksize=chunksize)
+            frames, read_files, new_index = collect_race_frames(xlsx_files, loaded)
+
+    if cache_dir is not None:
+        if prune:
+            # Записи удалённых гонок выбрасываем вместе с их файлами кэша
+            for file in set(cache_index) - set(xlsx_files):
+                stale_path = os.path.join(cache_dir, cache_index.pop(file)["cache"])
+                if os.path.exists(stale_path):
+                    os.remove(stale_path)
+        cache_index.update(new_index)
+        save_cache_index(cache_dir, cache_index)
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="merge")
+    return frames, read_files
+
+
+def merge_xlsx_files(input_folder, output_file, workers=None, cache_dir=None, incremental=False):
+    """Объединяет файлы гонок, добавляя столбец с названием гонки
+
+    Файлы разбираются параллельно в пуле процессов (workers=None - по числу
+    ядер, workers=1 - в текущем процессе) и склеиваются одним pd.concat
+    в порядке имён файлов. output_file - путь или список путей (.xlsx,
+    .json, .feather, .parquet). С cache_dir неизменившиеся файлы читаются
+    из колоночного кэша вместо повторного разбора xlsx.
+
+    С incremental=True в итоговые файлы дописываются только строки гонок,
+    которых в них ещё нет (список с размером и mtime файлов гонок ведётся в
+    <output>.state.json вместе с заголовком итоговых файлов). Новые строки
+    приводятся к порядку столбцов заголовка. Если гонка пропала или
+    изменилась (например, перекачана sync_races), у новых гонок другой набор
+    столбцов или итоговый файл изменён извне, всё пересобирается.
+    Возвращает записанные строки: всю таблицу или только новые гонки.
+    """
+    xlsx_files = sorted(
         f for f in os.listdir(input_folder) 
         if (f.lower().endswith('.xlsx') and
             any(keyword in f.upper() for keyword in ['MIKS', 'SHONX']) and
             'Квалификация' not in f)
-    ]
+    )
     
     if not xlsx_files:
         print("Не найдено подходящих XLSX-файлов.")
         return
     
-    merged_data = pd.DataFrame()
-    
-    for file in tqdm(xlsx_files, desc="Объединение файлов"):
-        file_path = os.path.join(input_folder, file)
-        try:
-            df = pd.read_excel(file_path, sheet_name='Список участников')
-            merged_data = pd.concat([merged_data, df], ignore_index=True)
-        except Exception as e:
-            print(f"\nОшибка в файле {file}: {str(e)}")
+    output_files = [output_file] if isinstance(output_file, str) else list(output_file)
+    # Отпечатки снимаются до чтения, чтобы гонка, изменённая во время объединения, не потерялась
+    fingerprints = race_fingerprints(input_folder, xlsx_files)
+    state = load_output_state(output_files) if incremental else None
+    written, columns = state if state is not None else (None, None)
+    if written is not None and not set(written) <= set(xlsx_files):
+        print("[!] Часть гонок пропала, итоговые файлы будут пересобраны")
+        written = None
+    if written is not None and any(fingerprints[file] != written[file] for file in written):
+        print("[!] Часть гонок изменилась, итоговые файлы будут пересобраны")
+        written = None
+
+    if written is not None:
+        new_files = [file for file in xlsx_files if file not in set(written)]
+        if not new_files:
+            print("Новых гонок нет, итоговые файлы актуальны.")
+            return pd.DataFrame()
+        frames, read_files = read_race_files(input_folder, new_files, workers, cache_dir)
+        if not frames:
+            print("Нет данных для сохранения.")
+            return pd.DataFrame()
+        new_data = pd.concat(frames, ignore_index=True)
+        if set(new_data.columns) != set(columns):
+            print("[!] Столбцы новых гонок не совпадают с итоговыми файлами, они будут пересобраны")
+        else:
+            # В xlsx строки пишутся по позиции столбцов, поэтому порядок приводится к заголовку
+            new_data = new_data[columns]
+            started = time.perf_counter()
+            try:
+                for path in output_files:
+                    append_merged(new_data, path)
+                    print(f"\nВ файл {path} добавлено строк: {len(new_data)}")
+                written.update({file: fingerprints[file] for file in read_files})
+                save_output_state(output_files, written, columns)
+                metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="output")
+                metrics.ROWS_MERGED.inc(len(new_data), mode="incremental")
+                return new_data
+            except Exception as e:
+                metrics.ERRORS.inc(stage="output", type=type(e).__name__)
+                print(f"\nОшибка при дописывании в {path}: {str(e)}, итоговые файлы будут пересобраны")
+
+    frames, read_files = read_race_files(input_folder, xlsx_files, workers, cache_dir, prune=True)
+    merged_data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
     if not merged_data.empty:
-        try:
-            with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-                merged_data.to_excel(writer, sheet_name='Список участников', index=False)
-            print(f"\nОбъединенный файл сохранен: {output_file}")
-        except Exception as e:
-            print(f"\nОшибка при сохранении: {str(e)}")
+        saved = True
+        started = time.perf_counter()
+        for path in output_files:
+            try:
+                save_merged(merged_data, path)
+                print(f"\nОбъединенный файл сохранен: {path}")
+            except Exception as e:
+                saved = False
+                metrics.ERRORS.inc(stage="output", type=type(e).__name__)
+                print(f"\nОшибка при сохранении: {str(e)}")
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="output")
+        if saved:
+            save_output_state(output_files, {file: fingerprints[file] for file in read_files},
+                              merged_data.columns)
+            metrics.ROWS_MERGED.inc(len(merged_data), mode="full")
     else:
         print("Нет данных для сохранения.")
+    return merged_data
+
+
+def collect_race_frames(xlsx_files, loaded):
+    """Собирает прочитанные таблицы в исходном порядке и печатает ошибки"""
+    frames = []
+    read_files = []
+    cache_index = {}
+    for file, (df, error, entry, info) in tqdm(zip(xlsx_files, loaded), total=len(xlsx_files),
+                                               desc="Объединение файлов"):
+        record_read(file, entry, info)
+        if error is not None:
+            print(f"\nОшибка в файле {file}: {error}")
+        else:
+            frames.append(df)
+            read_files.append(file)
+            if entry is not None:
+                cache_index[file] = entry
+    return frames, read_files, cache_index
+
+
+def record_read(file, entry, info):
+    """Заносит чтение одного файла гонки в метрики"""
+    metrics.PARSE_SECONDS.observe(info["seconds"], source=info["source"])
+    metrics.LAST_READ_SECONDS.set(info["seconds"], race=os.path.splitext(file)[0])
+    if info["error_type"]:
+        metrics.ERRORS.inc(stage="merge", type=info["error_type"])
+        return
+    metrics.FILES_PARSED.inc(source=info["source"])
+    if entry is not None:
+        metrics.CACHE_REQUESTS.inc(cache="feather", result="hit" if info["source"] == "cache" else "miss")
 
 if __name__ == "__main__":
 
+    # Полная перезагрузка нужна, только если папка или манифест испорчены
+    full_refresh = False
+
     folder_path = '/home/deta1l/Рабочий стол/training_py/miks_driverstats'
-    shutil.rmtree(folder_path)
-    print(f"Successfully deleted '{folder_path}' and all its contents.")
     # 1. Скачиваем файлы гонок
-    download_races()
+    if full_refresh:
+        shutil.rmtree(folder_path)
+        print(f"Successfully deleted '{folder_path}' and all its contents.")
+        download_races()
+    else:
+        sync_races()
     
     # 2. Объединяем скачанные файлы
     input_folder = "miks_driverstats"
     output_file = "/home/deta1l/Рабочий стол/training_py/output3.xlsx"
+    output_json = "/home/deta1l/Рабочий стол/training_py/output3.json"
+    output_columnar = "/home/deta1l/Рабочий стол/training_py/output3.feather"
     
     if os.path.exists(input_folder):
-        merge_xlsx_files(input_folder, output_file)
+        merge_xlsx_files(input_folder, [output_file, output_json, output_columnar],
+                         cache_dir=CACHE_DIR, incremental=True)
     else:
         print(f"Папка {input_folder} не существует!")
+
+    # 3. Метрики прогона для Prometheus (textfile-коллектор node_exporter)
+    metrics.write_textfile(METRICS_FILE)
@@ -0,0 +1,211 @@
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def escape_label(value):
+    """Экранирует значение метки: обратный слэш, перевод строки и кавычки"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    """Метки в формате Prometheus: {name="value",...}"""
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Общая часть метрик: имя, описание, метки и значения по наборам меток"""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for labels, value in items:
+            lines.extend(self.render_sample(labels, value))
+        return lines
+
+    def render_sample(self, labels, value):
+        return [f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"]
+
+
+class Counter(Metric):
+    """Монотонно растущий счётчик"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Текущее значение, например длительность последней обработки гонки"""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными корзинами (накопительные счётчики, сумма и число)"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замеряет длительность блока with"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render_sample(self, labels, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            bucket_labels = format_labels(self.labelnames, labels, [("le", format_value(bound))])
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        plain = format_labels(self.labelnames, labels)
+        lines.append(f"{self.name}_sum{plain} {format_value(total)}")
+        lines.append(f"{self.name}_count{plain} {count}")
+        return lines
+
+
+class Registry:
+    """Набор метрик, который отдаётся одним текстом в формате Prometheus"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "race_pipeline_stage_seconds", "Длительность этапа конвейера", ["stage"])
+DOWNLOAD_SECONDS = REGISTRY.histogram(
+    "race_download_seconds", "Длительность скачивания одной гонки", ["status"])
+PARSE_SECONDS = REGISTRY.histogram(
+    "race_file_read_seconds", "Чтение одного файла гонки с добавлением названия", ["source"])
+LAST_DOWNLOAD_SECONDS = REGISTRY.gauge(
+    "race_last_download_seconds", "Длительность последнего скачивания гонки", ["race"])
+LAST_READ_SECONDS = REGISTRY.gauge(
+    "race_last_read_seconds", "Длительность последнего чтения файла гонки", ["race"])
+DOWNLOADED_BYTES = REGISTRY.counter(
+    "race_downloaded_bytes_total", "Скачано байт")
+DOWNLOADS = REGISTRY.counter(
+    "race_downloads_total", "Запросы на скачивание гонок по результату", ["status"])
+FILES_PARSED = REGISTRY.counter(
+    "race_files_parsed_total", "Прочитанные файлы гонок по источнику (xlsx или кэш)", ["source"])
+ROWS_MERGED = REGISTRY.counter(
+    "race_rows_merged_total", "Строк записано в итоговые файлы", ["mode"])
+ERRORS = REGISTRY.counter(
+    "race_errors_total", "Ошибки по этапу и типу исключения", ["stage", "type"])
+CACHE_REQUESTS = REGISTRY.counter(
+    "race_cache_requests_total", "Обращения к кэшам по результату", ["cache", "result"])
+
+
+def write_textfile(path, registry=REGISTRY):
+    """Атомарно пишет метрики в файл для textfile-коллектора node_exporter"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+def start_http_server(port=9108, host="127.0.0.1", registry=REGISTRY):
+    """Отдаёт метрики по http://host:port/metrics в фоновом потоке"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,228 @@
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+
+COLUMNS = ('Рейтинг', 'Очки', 'Пилот', 'Команды', 'Название_гонки')
+
+def load_merged(path):
+    """Читает объединённую таблицу гонок (.feather, .parquet, .json или .xlsx)"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".feather":
+        return pd.read_feather(path)
+    if ext == ".parquet":
+        return pd.read_parquet(path)
+    if ext == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            return pd.DataFrame(json.load(f))
+    return pd.read_excel(path, sheet_name='Список участников')
+
+
+def build_index(codes, size):
+    """Группирует номера строк по коду: возвращает список массивов позиций"""
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(size + 1))
+    return [order[bounds[i]:bounds[i + 1]] for i in range(size)]
+
+
+class RaceStats:
+    """Колоночное хранилище результатов гонок с индексами по пилоту, команде и гонке
+
+    Строки хранятся как numpy-массивы, а строковые столбцы - как коды
+    словарей. Для каждого пилота, команды и гонки заранее известны номера
+    её строк, поэтому запросы не сканируют всю таблицу.
+    """
+
+    def __init__(self, df):
+        self.rating = df['Рейтинг'].to_numpy()
+        self.points = df['Очки'].to_numpy(dtype=np.float64)
+        # Значения очищаются от пробелов по краям так же, как запросы
+        pilot_codes, self.pilots = pd.factorize(df['Пилот'].astype(str).str.strip())
+        team_codes, self.teams = pd.factorize(df['Команды'].astype(str).str.strip())
+        race_codes, self.races = pd.factorize(df['Название_гонки'].astype(str).str.strip())
+        self.pilot_codes = pilot_codes.astype(np.int32)
+        self.team_codes = team_codes.astype(np.int32)
+        self.race_codes = race_codes.astype(np.int32)
+
+        self.pilot_rows = build_index(self.pilot_codes, len(self.pilots))
+        self.team_rows = build_index(self.team_codes, len(self.teams))
+        self.race_rows = build_index(self.race_codes, len(self.races))
+        self.pilot_lookup = {name: i for i, name in enumerate(self.pilots)}
+        self.team_lookup = {name: i for i, name in enumerate(self.teams)}
+        self.race_lookup = {name: i for i, name in enumerate(self.races)}
+        self.race_matches = {}
+
+    @classmethod
+    def from_file(cls, path):
+        """Загружает объединённый файл один раз и строит индексы"""
+        return cls(load_merged(path))
+
+    def __len__(self):
+        return len(self.points)
+
+    def rows(self, positions):
+        """Превращает номера строк в список записей"""
+        positions = np.asarray(positions, dtype=np.intp)
+        columns = zip(
+            self.rating[positions].tolist(),
+            self.points[positions].tolist(),
+            self.pilots[self.pilot_codes[positions]].tolist(),
+            self.teams[self.team_codes[positions]].tolist(),
+            self.races[self.race_codes[positions]].tolist(),
+        )
+        return [dict(zip(COLUMNS, row)) for row in columns]
+
+    def pilot_results(self, pilot):
+        """Все результаты пилота в порядке исходной таблицы"""
+        code = self.pilot_lookup.get(pilot.strip())
+        if code is None:
+            return []
+        return self.rows(self.pilot_rows[code])
+
+    def team_results(self, team):
+        """Все результаты команды в порядке исходной таблицы"""
+        code = self.team_lookup.get(team.strip())
+        if code is None:
+            return []
+        return self.rows(self.team_rows[code])
+
+    def race_standings(self, race):
+        """Итоговая таблица гонки, отсортированная по рейтингу"""
+        code = self.race_lookup.get(race.strip())
+        if code is None:
+            return []
+        positions = self.race_rows[code]
+        positions = positions[np.argsort(self.rating[positions], kind="stable")]
+        return self.rows(positions)
+
+    def matching_races(self, pattern):
+        """Номера строк гонок, название которых подходит под регулярное выражение"""
+        positions = self.race_matches.get(pattern)
+        if positions is None:
+            regex = re.compile(pattern, re.IGNORECASE)
+            codes = [i for i, name in enumerate(self.races) if regex.search(name)]
+            positions = (np.concatenate([self.race_rows[code] for code in codes])
+                         if codes else np.empty(0, dtype=np.intp))
+            if len(self.race_matches) >= 256:
+                self.race_matches.clear()
+            self.race_matches[pattern] = positions
+        return positions
+
+    def top_pilots(self, pattern=".*", n=10):
+        """Топ-N пилотов по сумме очков в гонках, подходящих под шаблон"""
+        positions = self.matching_races(pattern)
+        if not len(positions):
+            return []
+        totals = np.bincount(self.pilot_codes[positions], weights=self.points[positions],
+                             minlength=len(self.pilots))
+        starts = np.bincount(self.pilot_codes[positions], minlength=len(self.pilots))
+        candidates = np.flatnonzero(starts)
+        n = min(n, len(candidates))
+        if n <= 0:
+            return []
+        best = candidates[np.argpartition(-totals[candidates], n - 1)[:n]]
+        best = best[np.lexsort((best, -totals[best]))]
+        return [
+            {'Пилот': self.pilots[code], 'Очки': float(totals[code]), 'Гонок': int(starts[code])}
+            for code in best
+        ]
+
+
+class QueryCache:
+    """Небольшой LRU-кэш готовых JSON-ответов"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                return self.items[key]
+        return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+
+def make_handler(stats, cache):
+    """Создаёт обработчик HTTP-запросов к хранилищу"""
+
+    routes = {
+        "/pilot": lambda q: stats.pilot_results(q.get("name", [""])[0]),
+        "/team": lambda q: stats.team_results(q.get("name", [""])[0]),
+        "/race": lambda q: stats.race_standings(q.get("name", [""])[0]),
+        "/top": lambda q: stats.top_pilots(q.get("pattern", [".*"])[0], int(q.get("n", ["10"])[0])),
+        "/races": lambda q: list(stats.races),
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            route = routes.get(url.path)
+            if route is None:
+                self.send_json(404, {"error": f"неизвестный запрос {url.path}"})
+                return
+            body = cache.get(self.path)
+            if body is None:
+                try:
+                    result = route(parse_qs(url.query))
+                except (ValueError, re.error) as e:
+                    self.send_json(400, {"error": str(e)})
+                    return
+                body = json.dumps(result, ensure_ascii=False).encode("utf-8")
+                cache.put(self.path, body)
+            self.send_body(200, body)
+
+        def send_json(self, status, payload):
+            self.send_body(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+        def send_body(self, status, body):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(stats, host="127.0.0.1", port=8765, cache_size=1024):
+    """Запускает локальный HTTP/JSON-сервер с кэшем результатов
+
+    Запросы: /pilot?name=, /team?name=, /race?name=, /top?pattern=&n=, /races
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(stats, QueryCache(cache_size)))
+    print(f"[+] Сервер статистики: http://{host}:{server.server_port}/")
+    return server
+
+
+if __name__ == "__main__":
+    merged_file = "output3.json"
+    if os.path.exists("output3.feather"):
+        merged_file = "output3.feather"
+
+    stats = RaceStats.from_file(merged_file)
+    print(f"[+] Загружено результатов: {len(stats)}, пилотов: {len(stats.pilots)}, "
+          f"гонок: {len(stats.races)}")
+    server = serve(stats)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()